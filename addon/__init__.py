@@ -13,6 +13,7 @@ def register():
 
 
 def unregister():
+    utils.wine.shutdown()
     ui.unregister()
     ops.unregister()
     props.unregister()
@@ -3,6 +3,7 @@ from . import open_folder
 from . import export_meshes
 from . import generate_qc
 from . import compile_qc
+from . import compile_background
 from . import view_model
 from . import export_auto
 from . import list_operator
@@ -18,6 +19,7 @@ classes = (
     export_meshes.SOURCEOPS_OT_ExportMeshes,
     generate_qc.SOURCEOPS_OT_GenerateQC,
     compile_qc.SOURCEOPS_OT_CompileQC,
+    compile_background.SOURCEOPS_OT_CompileBackground,
     view_model.SOURCEOPS_OT_ViewModel,
     export_auto.SOURCEOPS_OT_ExportAuto,
     list_operator.SOURCEOPS_OT_ListOperator,
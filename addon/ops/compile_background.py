@@ -0,0 +1,96 @@
+import bpy
+import time
+from .. import utils
+from .. types . model_export . model import Model
+from .. types . model_export . scheduler import Scheduler
+
+
+class SOURCEOPS_OT_CompileBackground(bpy.types.Operator):
+    bl_idname = 'sourceops.compile_background'
+    bl_options = {'REGISTER'}
+    bl_label = 'Compile in Background'
+    bl_description = 'Compile this model\'s QC file without blocking Blender.\nShift click to compile all models.\nPress Esc to cancel'
+
+    # The scheduler of the current or last run, drawn by the panel.
+    scheduler = None
+
+    @classmethod
+    def poll(cls, context):
+        prefs = utils.common.get_prefs(context)
+        game = utils.common.get_game(prefs)
+        sourceops = utils.common.get_globals(context)
+        model = utils.common.get_model(sourceops)
+        return prefs and game and sourceops and model and not cls.is_running()
+
+    @classmethod
+    def is_running(cls):
+        return cls.scheduler is not None and not cls.scheduler.done()
+
+    def invoke(self, context, event):
+        prefs = utils.common.get_prefs(context)
+        game = utils.common.get_game(prefs)
+        sourceops = utils.common.get_globals(context)
+
+        if not utils.game.verify(game):
+            self.report({'ERROR'}, 'Game is invalid')
+            return {'CANCELLED'}
+
+        if event.shift:
+            models = sourceops.model_items
+        else:
+            models = [utils.common.get_model(sourceops)]
+
+        self._start = time.time()
+        scheduler = Scheduler(prefs.compile_jobs)
+
+        for model in models:
+            source_model = Model(game, model)
+            scheduler.submit(model.name, source_model.compile_qc, timeout=prefs.compile_timeout, cancel=source_model.cancel_compile)
+
+        SOURCEOPS_OT_CompileBackground.scheduler = scheduler
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.25, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        scheduler = SOURCEOPS_OT_CompileBackground.scheduler
+
+        if event.type == 'ESC' and event.value == 'PRESS':
+            running = scheduler.cancel()
+
+            if running:
+                self.report({'INFO'}, f'Cancel requested, {running} running compiles will finish first')
+
+            return {'RUNNING_MODAL'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        self.redraw(context)
+
+        if not scheduler.done():
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        errors = scheduler.wait()
+
+        for error in errors:
+            self.report({'ERROR'}, error)
+
+        if scheduler.cancelled.is_set():
+            self.report({'WARNING'}, f'Cancelled compiling ({scheduler.summary()})')
+            return {'CANCELLED'}
+
+        if errors:
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f'Compiled {len(scheduler.jobs)} models in {round(time.time() - self._start, 1)} seconds')
+        return {'FINISHED'}
+
+    def redraw(self, context):
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
@@ -1,8 +1,9 @@
 import bpy
 import time
-from threading import Lock, Thread
 from .. import utils
 from .. types . model_export . model import Model
+from .. types . model_export . scheduler import Scheduler
+from .. types . model_export . serialize import Pool
 
 
 class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
@@ -19,6 +20,7 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
     generate_qc: bpy.props.BoolProperty(name='Generate QC', description='Generate the QC based on your settings', default=True)
     compile_qc: bpy.props.BoolProperty(name='Compile QC', description='Compile the QC to an MDL', default=True)
     view_model: bpy.props.BoolProperty(name='View Model', description='Open the selected model in HLMV', default=False)
+    pipeline: bpy.props.BoolProperty(name='Pipeline', description='When exporting all models, start compiling each model as soon as it is exported, while the next ones are still exporting', default=True)
 
     def draw(self, context):
         layout = self.layout
@@ -33,6 +35,10 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
         row.enabled = not self.all_models
         row.prop(self, 'view_model')
 
+        row = col.row()
+        row.enabled = self.all_models
+        row.prop(self, 'pipeline')
+
     @classmethod
     def poll(cls, context):
         prefs = utils.common.get_prefs(context)
@@ -64,30 +70,45 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
 
         start = time.time()
 
-        self._lock = Lock()
-        self._results = []
-
         if (not self.ctrl and self.shift) or (self.ctrl and self.all_models):
             source_models = [Model(game, model) for model in sourceops.model_items]
 
-            for source_model in source_models:
-                error = self.export(source_model)
-                if error:
-                    self.report({'ERROR'}, error)
-                    return {'CANCELLED'}
-
-            threads = [Thread(target=self.compile, args=[m], daemon=True) for m in source_models]
-
-            for thread in threads:
-                thread.start()
-
-            for thread in threads:
-                thread.join()
-
-            for error in self._results:
+            # Compile a bounded number of models at a time, each compile runs its own studiomdl process.
+            # When pipelining, a model compiles in the background while the next one is exported here.
+            scheduler = Scheduler(prefs.compile_jobs)
+
+            # Every model writes its SMDs with the same worker processes, they start once for the whole run.
+            pool = Pool()
+
+            try:
+                for source_model in source_models:
+                    error = self.export(source_model, pool)
+                    if error:
+                        scheduler.cancel()
+                        scheduler.wait()
+                        self.report({'ERROR'}, error)
+                        return {'CANCELLED'}
+
+                    if self.pipeline:
+                        scheduler.submit(source_model.name, self.compile, source_model, timeout=prefs.compile_timeout)
+            except BaseException:
+                # Don't leave compiles that were already submitted running after the operator failed.
+                scheduler.cancel()
+                scheduler.wait()
+                raise
+            finally:
+                pool.shutdown()
+
+            if not self.pipeline:
+                for source_model in source_models:
+                    scheduler.submit(source_model.name, self.compile, source_model, timeout=prefs.compile_timeout)
+
+            errors = scheduler.wait()
+
+            for error in errors:
                 self.report({'ERROR'}, error)
 
-            if self._results:
+            if errors:
                 return {'CANCELLED'}
 
             self.report({'INFO'}, f'Exported all models in the scene in {round(time.time() - start, 1)} seconds')
@@ -102,7 +123,7 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
                 self.report({'ERROR'}, error)
                 return {'CANCELLED'}
 
-            error = self.compile(source_model)
+            error = self.compile(source_model, prefs.compile_timeout)
             if error:
                 self.report({'ERROR'}, error)
                 return {'CANCELLED'}
@@ -113,9 +134,9 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
             self.report({'INFO'}, f'Exported {model.name} in {round(time.time() - start, 1)} seconds{static_message}')
             return {'FINISHED'}
 
-    def export(self, source_model: Model):
+    def export(self, source_model: Model, pool: Pool = None):
         if not self.ctrl or self.export_meshes:
-            error = source_model.export_meshes()
+            error = source_model.export_meshes(pool)
             if error:
                 return error
 
@@ -124,17 +145,13 @@ class SOURCEOPS_OT_ExportAuto(bpy.types.Operator):
             if error:
                 return error
 
-    def compile(self, source_model: Model):
+    def compile(self, source_model: Model, timeout=0):
         if not self.ctrl or self.compile_qc:
-            error = source_model.compile_qc()
+            error = source_model.compile_qc(timeout or None)
             if error:
-                with self._lock:
-                    self._results.append(error)
-                return
+                return error
 
         if self.ctrl and (not self.all_models and self.view_model):
             error = source_model.view_model()
             if error:
-                with self._lock:
-                    self._results.append(error)
-                return
+                return error
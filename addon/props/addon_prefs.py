@@ -14,6 +14,39 @@ class SOURCEOPS_AddonPrefs(bpy.types.AddonPreferences):
         update=utils.common.update_wine,
     )
 
+    wine_prefix: bpy.props.StringProperty(
+        name='Wine Prefix',
+        description='Wine prefix to run StudioMDL and HLMV in, one wineserver is kept running for it until a while after the last program exits.\nLeave empty to use WINEPREFIX or ~/.wine',
+        subtype='DIR_PATH',
+        update=utils.common.update_wine_prefix,
+    )
+
+    compile_cache: bpy.props.BoolProperty(
+        name='Compile Cache',
+        description='Keep compiled models in a local cache, keyed by the hash of their QC and SMD/FBX files.\nUndoing an edit or switching branches then restores the model instead of compiling it again',
+        default=False,
+    )
+
+    link_outputs: bpy.props.BoolProperty(
+        name='Hard Link Outputs',
+        description='Hard link compiled models instead of copying them, between the compile cache and your models folder.\nOnly works when both are on the same drive, copies are made otherwise',
+        default=False,
+    )
+
+    compile_jobs: bpy.props.IntProperty(
+        name='Compile Jobs',
+        description='How many models to compile at the same time when exporting all models.\nUse 0 for the number of CPU cores',
+        default=0,
+        min=0,
+    )
+
+    compile_timeout: bpy.props.IntProperty(
+        name='Compile Timeout',
+        description='Seconds after which a compile is stopped and counted as failed.\nUse 0 for no limit',
+        default=0,
+        min=0,
+    )
+
     game_items: bpy.props.CollectionProperty(type=SOURCEOPS_GameProps)
     game_index: bpy.props.IntProperty(default=0, name='Ctrl click to rename')
 
@@ -24,6 +57,12 @@ class SOURCEOPS_AddonPrefs(bpy.types.AddonPreferences):
 
         if os.name == 'posix':
             layout.prop(self, 'wine')
+            layout.prop(self, 'wine_prefix')
+
+        layout.prop(self, 'compile_cache')
+        layout.prop(self, 'link_outputs')
+        layout.prop(self, 'compile_jobs')
+        layout.prop(self, 'compile_timeout')
 
         row = layout.row()
         row.operator('sourceops.backup_preferences')
@@ -53,3 +53,13 @@ class SOURCEOPS_GameProps(bpy.types.PropertyGroup):
         ],
         default='SMD',
     )
+
+    fbx_writer: bpy.props.EnumProperty(
+        name='FBX Writer',
+        description='How to write FBX files',
+        items=[
+            ('BLENDER', 'Blender', 'Use the FBX exporter that comes with Blender'),
+            ('NATIVE', 'Native', 'Write meshes, materials, skeleton and weights directly, much faster for many objects.\nShape keys and other extras are not written'),
+        ],
+        default='BLENDER',
+    )
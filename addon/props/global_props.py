@@ -10,6 +10,40 @@ class SOURCEOPS_GlobalProps(bpy.types.PropertyGroup):
     map_items: bpy.props.CollectionProperty(type=SOURCEOPS_MapProps)
     map_index: bpy.props.IntProperty(default=0, name='Ctrl click to rename')
 
+    diagnostics_search: bpy.props.StringProperty(
+        name='Search',
+        description='Only show diagnostics whose model, message, SMD or material contains this text',
+        options={'TEXTEDIT_UPDATE'},
+    )
+
+    diagnostics_severity: bpy.props.EnumProperty(
+        name='Severity',
+        description='Which diagnostics to show',
+        items=[
+            ('ALL', 'All', 'Show errors and warnings'),
+            ('ERROR', 'Errors', 'Show only errors'),
+            ('WARNING', 'Warnings', 'Show only warnings'),
+        ],
+        default='ALL',
+    )
+
+    diagnostics_sort: bpy.props.EnumProperty(
+        name='Sort By',
+        description='How to sort diagnostics',
+        items=[
+            ('MODEL', 'Model', 'Sort by model, then by log line'),
+            ('SEVERITY', 'Severity', 'Show errors first'),
+            ('MESSAGE', 'Message', 'Sort by message, so the same problem in different models is grouped'),
+        ],
+        default='MODEL',
+    )
+
+    diagnostics_all_games: bpy.props.BoolProperty(
+        name='All Games',
+        description='Show diagnostics of models compiled for every game, not just the selected one',
+        default=False,
+    )
+
     simulation_input: bpy.props.PointerProperty(
         name='Simulation Input',
         description='The collection containing your rigid body objects',
@@ -34,6 +68,7 @@ class SOURCEOPS_GlobalProps(bpy.types.PropertyGroup):
             ('EVENTS', 'Events', 'Display the events panel', 'ACTION', 6),
             ('ATTACHMENTS', 'Attachments', 'Display the attachments panel', 'BONE_DATA', 7),
             ('PARTICLES', 'Particles', 'Display the particles panel', 'PARTICLES', 8),
+            ('DIAGNOSTICS', 'Diagnostics', 'Display the compile diagnostics panel', 'ERROR', 12),
             ('MAPS', 'Maps', 'Display the maps panel', 'MOD_BUILD', 9),
             ('SIMULATION', 'Simulation', 'Display the simulation panel', 'PHYSICS', 10),
             ('MISC', 'Misc', 'Display the misc panel', 'MONKEY', 11),
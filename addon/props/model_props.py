@@ -135,6 +135,38 @@ class SOURCEOPS_ModelProps(bpy.types.PropertyGroup):
         default=False,
     )
 
+    limit_weights: bpy.props.BoolProperty(
+        name='Limit Weights',
+        description='Keep only the 3 strongest bone weights of every vertex in your SMD files and renormalize them, Source supports no more than 3',
+        default=False,
+    )
+
+    sampling: bpy.props.EnumProperty(
+        name='Animation Sampling',
+        description='How to sample actions when exporting sequences',
+        items=[
+            ('SCENE', 'Scene', 'Evaluate the whole scene at every frame.\nSupports constraints, drivers and NLA'),
+            ('ACTION', 'Action', 'Evaluate the F-curves of the action directly, much faster for heavy scenes.\nIt ignores NLA, action blending, influence and extrapolation, so armatures that use any of those, or constraints or drivers, fall back to Scene'),
+        ],
+        default='SCENE',
+    )
+
+    triangulation: bpy.props.EnumProperty(
+        name='Triangulation',
+        description='How to triangulate meshes for SMD files and the native FBX writer',
+        items=[
+            ('LOOP_TRIANGLES', 'Loop Triangles', 'Read the triangles Blender already made for the evaluated mesh, much faster for scenes with many objects.\nObjects with armature modifiers, or outside the view layer, are read from a copy, triangulated the same way.\nFaces may be split differently than with Modifier'),
+            ('MODIFIER', 'Modifier', 'Triangulate a copy of every object with a Triangulate modifier.\nQuads are split on a fixed diagonal and n-gons are clipped, the same as earlier versions'),
+        ],
+        default='MODIFIER',
+    )
+
+    skip_unchanged: bpy.props.BoolProperty(
+        name='Skip Unchanged',
+        description='Only export SMD/FBX files whose objects, armature, action or settings changed since the last export.\nFingerprints are kept in a manifest file next to the QC',
+        default=True,
+    )
+
     origin_source: bpy.props.EnumProperty(
         name='Origin Source',
         description='Method of specifying $origin.\nEither manually specified in this panel, or via an object',
@@ -1,3 +1,4 @@
+from . import formatting
 from . import pyvmf
 from . import model_export
 from . import map_export
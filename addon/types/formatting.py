@@ -0,0 +1,57 @@
+'''Bulk text formatting for SMD, QC and VMF export.
+
+This module only depends on NumPy and must not use relative imports,
+worker processes load it on its own without the rest of the addon.
+'''
+
+import numpy
+from typing import Sequence
+
+
+FLOAT = '%.6f'
+INT = '%d'
+STRING = '%s'
+
+
+def row_template(fields: Sequence[str], separator: str = ' ', end: str = '\n') -> str:
+    '''Build a %-style template for one row, from the template of each field.'''
+    return separator.join(fields) + end
+
+
+def float_template(count: int, separator: str = ' ') -> str:
+    '''Build a template for a fixed number of fixed precision floats, without line ending.'''
+    return separator.join([FLOAT] * count)
+
+
+def columns(*arrays) -> numpy.ndarray:
+    '''Join 1D and 2D arrays column wise into an object array of Python values, there has to be at least one array.'''
+    count = len(arrays[0])
+    parts = [numpy.asarray(array, dtype=object) for array in arrays]
+
+    # The width comes from the shape, so empty arrays keep their columns too.
+    return numpy.hstack([part.reshape(count, int(numpy.prod(part.shape[1:]))) for part in parts])
+
+
+def format_rows(template: str, rows) -> str:
+    '''Format every row with the same template in a single % operation.
+
+    Rows can be a 2D array or a list of equal length sequences.
+    The result is identical to formatting each value separately with the same format spec.
+    '''
+    count = len(rows)
+
+    if not count:
+        return ''
+
+    if isinstance(rows, numpy.ndarray):
+        values = rows.ravel().tolist()
+    else:
+        values = [value for row in rows for value in row]
+
+    return (template * count) % tuple(values)
+
+
+def format_floats(values, separator: str = ' ') -> str:
+    '''Format a flat sequence of floats with fixed precision.'''
+    values = numpy.asarray(values).ravel().tolist()
+    return float_template(len(values), separator) % tuple(values)
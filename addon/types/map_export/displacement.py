@@ -4,6 +4,7 @@ import mathutils
 import math
 import typing
 from .. pyvmf import pyvmf
+from .. import formatting
 
 
 def get_levels_and_width(obj: bpy.types.Object):
@@ -311,13 +312,17 @@ def convert_object(settings: typing.Any, obj: bpy.types.Object):
         distances = pyvmf.Child('distances', {})
         children = [normals, distances]
 
+        # Prepare row templates
+        normals_template = formatting.row_template([formatting.STRING] * 3 * (width + 1), end='')
+        distances_template = formatting.row_template([formatting.STRING] * (width + 1), end='')
+
         # Populate dispinfo normals
         for index, row in enumerate(displacement['normals']):
-            normals.dic[f'row{index}'] = ' '.join(f'{x} {y} {z}' for x, y, z in row)
+            normals.dic[f'row{index}'] = formatting.format_rows(normals_template, [[n for normal in row for n in normal]])
 
         # Populate dispinfo distances
         for index, row in enumerate(displacement['lengths']):
-            distances.dic[f'row{index}'] = ' '.join(f'{length}' for length in row)
+            distances.dic[f'row{index}'] = formatting.format_rows(distances_template, [row])
 
         # Create dispinfo for top face
         f1.dispinfo = pyvmf.DispInfo(dic=dic, children=children)
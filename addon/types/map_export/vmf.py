@@ -3,6 +3,7 @@ import bmesh
 import mathutils
 import pathlib
 from .. pyvmf import pyvmf
+from ... utils.scene_state import SceneState
 from . import brush
 from . import displacement
 
@@ -29,13 +30,12 @@ class Settings:
 
 class VMF:
     def __init__(self, settings: Settings):
-        scene_settings = self.configure_scene(settings.brush_objects + settings.disp_objects)
+        with SceneState() as state:
+            self.configure_scene(state, settings.brush_objects + settings.disp_objects)
 
-        brush_solids = brush.convert_objects(settings, settings.brush_objects)
-        displacement_solids = displacement.convert_objects(settings, settings.disp_objects)
-        self.solids = brush_solids + displacement_solids
-
-        self.restore_scene(scene_settings)
+            brush_solids = brush.convert_objects(settings, settings.brush_objects)
+            displacement_solids = displacement.convert_objects(settings, settings.disp_objects)
+            self.solids = brush_solids + displacement_solids
 
 
     def export(self, path):
@@ -48,38 +48,14 @@ class VMF:
         vmf.export(str(path))
 
 
-    def configure_scene(self, objects):
-        scene_settings = {o: {} for o in objects}
-        scene_settings['objects'] = objects
-
-        if bpy.context.active_object:
-            scene_settings['mode'] = bpy.context.active_object.mode
-        else:
-            scene_settings['mode'] = 'OBJECT'
-
-        if scene_settings['mode'] != 'OBJECT':
-            bpy.ops.object.mode_set(mode='OBJECT')
+    def configure_scene(self, state, objects):
+        state.object_mode()
 
         for object in objects:
-            scene_settings[object]['in_scene'] = bpy.context.scene.collection in object.users_collection
-            if not scene_settings[object]['in_scene']:
-                bpy.context.scene.collection.objects.link(object)
-
-            scene_settings[object]['hide_viewport'] = True if object.hide_viewport else False
-            object.hide_viewport = False
-
-        return scene_settings
-
-
-    def restore_scene(self, scene_settings):
-        for object in scene_settings['objects']:
-            if not scene_settings[object]['in_scene']:
-                bpy.context.scene.collection.objects.unlink(object)
-
-            object.hide_viewport = scene_settings[object]['hide_viewport']
+            state.link(bpy.context.scene.collection, object)
+            state.show(object)
 
-        if scene_settings['mode'] != 'OBJECT':
-            bpy.ops.object.mode_set(mode=scene_settings['mode'])
+        state.update()
 
 
     def evaluated_get(self, objects):
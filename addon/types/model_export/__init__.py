@@ -1,3 +1,11 @@
 from . import model
+from . import serialize
 from . import smd
 from . import fbx
+from . import fbx_binary
+from . import fbx_scene
+from . import publish
+from . import qc
+from . import compile_cache
+from . import scheduler
+from . import compile_log
@@ -0,0 +1,161 @@
+import json
+import re
+import shutil
+from hashlib import blake2b
+from pathlib import Path
+from . publish import SUFFIXES, Publisher, transfer
+
+
+class CompileCache:
+    '''Remembers which sources the compiled model was made from, so unchanged models aren't compiled again.
+    With an artifact directory, compiled models are also kept by the hash of their sources and restored from there.'''
+
+    # Bump this when the compile command changes in a way that affects the output.
+    VERSION = 1
+
+    SOURCES = ('.smd', '.fbx', '.dmx', '.vta', '.qc', '.qci')
+    QUOTED = re.compile(r'"([^"]+)"')
+
+    # Artifact entries beyond this many are removed, oldest first.
+    MAX_ENTRIES = 128
+
+    def __init__(self, qc: Path, model: Path, artifacts: Path = None, link: bool = False, text: str = None):
+        self.qc = qc
+        self.model = model
+        self.artifacts = artifacts
+        self.link = link
+        self.text = text
+        self.stamp = qc.with_suffix('.compile.json')
+        self.key = None
+
+    def qc_text(self) -> str:
+        '''Get the QC as it was just generated, it's only read from disk when it wasn't generated in this export.'''
+        if self.text is None:
+            self.text = self.qc.read_text(errors='replace')
+
+        return self.text
+
+    def references(self) -> list:
+        '''Find the source files the QC refers to, not including the QC itself.'''
+        paths = []
+
+        for match in self.QUOTED.finditer(self.qc_text()):
+            path = self.qc.parent.joinpath(match.group(1))
+
+            if path.suffix.lower() in self.SOURCES and path.is_file() and path != self.qc and path not in paths:
+                paths.append(path)
+
+        return paths
+
+    def compute(self, studiomdl: Path, *settings) -> str:
+        '''Hash the QC, every file it refers to, the compiler and its settings.'''
+        hash = blake2b(digest_size=16)
+
+        try:
+            stat = studiomdl.stat()
+            hash.update(repr((self.VERSION, str(studiomdl), stat.st_size, stat.st_mtime_ns) + tuple(map(str, settings))).encode())
+            hash.update(self.qc_text().encode() + b'\0')
+
+            for path in self.references():
+                hash.update(path.relative_to(self.qc.parent).as_posix().encode() + b'\0')
+
+                with path.open('rb') as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b''):
+                        hash.update(chunk)
+
+                hash.update(b'\0')
+
+        except (OSError, ValueError):
+            self.key = None
+        else:
+            self.key = hash.hexdigest()
+
+        return self.key
+
+    def outputs(self) -> dict:
+        '''Get the size and modification time of every compiled file that exists.'''
+        outputs = {}
+
+        for suffix in SUFFIXES:
+            path = self.model.with_suffix(suffix)
+
+            if path.is_file():
+                stat = path.stat()
+                outputs[suffix] = [stat.st_size, stat.st_mtime_ns]
+
+        return outputs
+
+    def is_current(self) -> bool:
+        '''Check whether the compiled model was made from these sources and is still there, untouched.'''
+        if not self.key:
+            return False
+
+        try:
+            with self.stamp.open('r') as file:
+                stamp = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        return stamp.get('key') == self.key and '.mdl' in stamp.get('outputs', {}) and stamp['outputs'] == self.outputs()
+
+    def restore(self) -> bool:
+        '''Copy a model compiled from the same sources out of the artifact directory.'''
+        if not self.key or not self.artifacts:
+            return False
+
+        entry = self.artifacts.joinpath(self.key)
+
+        if not entry.joinpath(self.model.name).with_suffix('.mdl').is_file():
+            return False
+
+        publisher = Publisher(self.model, self.link)
+
+        try:
+            publisher.stage(entry.joinpath(self.model.name), keep=True)
+            publisher.publish()
+        finally:
+            publisher.discard()
+
+        entry.touch()
+        self.save()
+        return True
+
+    def store(self):
+        '''Remember the sources of a model that was just compiled, and keep a copy of it if there is an artifact directory.'''
+        if not self.key:
+            return
+
+        self.save()
+
+        if not self.artifacts:
+            return
+
+        entry = self.artifacts.joinpath(self.key)
+        staging = self.artifacts.joinpath(f'{self.key}.tmp')
+
+        if entry.is_dir():
+            return entry.touch()
+
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        for suffix in SUFFIXES:
+            src = self.model.with_suffix(suffix)
+
+            if src.is_file():
+                transfer(src, staging.joinpath(self.model.name).with_suffix(suffix), keep=True, link=self.link)
+
+        # Rename the finished entry into place, so a partial copy is never restored.
+        staging.rename(entry)
+        self.prune()
+
+    def save(self):
+        with self.stamp.open('w') as file:
+            json.dump({'key': self.key, 'outputs': self.outputs()}, file, indent=4)
+
+    def prune(self):
+        entries = [path for path in self.artifacts.iterdir() if path.is_dir() and not path.suffix]
+        entries.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+
+        for path in entries[self.MAX_ENTRIES:]:
+            shutil.rmtree(path, ignore_errors=True)
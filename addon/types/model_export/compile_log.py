@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO, Callable, List
+
+
+class Diagnostic:
+    def __init__(self, severity: str, line: int, message: str, smd: str = '', material: str = ''):
+        self.severity = severity
+        self.line = line
+        self.message = message
+        self.smd = smd
+        self.material = material
+
+    def __str__(self) -> str:
+        return f'{self.severity.title()} on log line {self.line}: {self.message}'
+
+    def to_dict(self) -> dict:
+        return {'severity': self.severity, 'line': self.line, 'message': self.message, 'smd': self.smd, 'material': self.material}
+
+
+class CompileLog:
+    '''Copy studiomdl output into the log file line by line, and pick out errors and warnings as they arrive.'''
+
+    # Only lines that start with ERROR: are errors, studiomdl prints those right before it gives up.
+    ERROR = re.compile(r'^ERROR:\s*(.*)$')
+    WARNING = re.compile(r'^\s*\**\s*WARNING\b\s*:?\s*(.*)$', re.IGNORECASE)
+
+    # Problems studiomdl reports without a prefix, some are harmless like "Can't find steam app user info.", so they are only warnings.
+    SUSPECT = re.compile(r'too many (verts|vertices|bones|materials)|could not (load|open)|can\'?t (load|open|find)|bone weight|weights? (truncated|ignored)|degenerate', re.IGNORECASE)
+
+    # Studiomdl names the file it is working on in some lines and not in others, the last one named is used for the rest.
+    SOURCE = re.compile(r'([^\s"\'()]+\.(?:smd|fbx|dmx|vta))\b', re.IGNORECASE)
+    # Studiomdl quotes the names of materials it can't find or load.
+    MATERIAL = re.compile(r'material\s+"([^"]+)"\s+not found|could not load material\s+"([^"]+)"', re.IGNORECASE)
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.diagnostics: List[Diagnostic] = []
+        self.source = ''
+
+    @property
+    def errors(self) -> List[Diagnostic]:
+        return [diagnostic for diagnostic in self.diagnostics if diagnostic.severity == 'ERROR']
+
+    @property
+    def warnings(self) -> List[Diagnostic]:
+        return [diagnostic for diagnostic in self.diagnostics if diagnostic.severity == 'WARNING']
+
+    def parse(self, number: int, line: str) -> Diagnostic:
+        source = self.SOURCE.search(line)
+        if source:
+            self.source = Path(source.group(1).replace('\\', '/')).name
+
+        diagnostic = self.classify(number, line)
+
+        if diagnostic:
+            material = self.MATERIAL.search(line)
+            diagnostic.smd = self.source
+            diagnostic.material = material.group(1) or material.group(2) if material else ''
+
+        return diagnostic
+
+    def classify(self, number: int, line: str) -> Diagnostic:
+        for severity, pattern in (('ERROR', self.ERROR), ('WARNING', self.WARNING)):
+            match = pattern.match(line)
+
+            if match:
+                return Diagnostic(severity, number, match.group(1).strip() or line.strip())
+
+        if self.SUSPECT.search(line):
+            return Diagnostic('WARNING', number, line.strip())
+
+    def read(self, stream: BinaryIO, on_diagnostic: Callable = None):
+        '''Read the output until it ends, the log file is written as lines come in so it can be followed.'''
+        with self.path.open('w', encoding='utf-8', buffering=1) as log:
+            for number, raw in enumerate(stream, start=1):
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                log.write(f'{line}\n')
+
+                diagnostic = self.parse(number, line)
+
+                if diagnostic:
+                    self.diagnostics.append(diagnostic)
+
+                    if on_diagnostic:
+                        on_diagnostic(diagnostic)
+
+
+class DiagnosticsIndex:
+    '''Diagnostics of the last compile of every model, kept in one file so they can be searched without opening logs.'''
+
+    # Compiles on different threads update the same file.
+    lock = Lock()
+
+    # Parsed contents by path, reloaded when the file changes, the panel reads this on every redraw.
+    loaded = {}
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return {}
+
+        cached = self.loaded.get(self.path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with self.path.open('r', encoding='utf-8') as file:
+                models = json.load(file).get('models', {})
+        except (OSError, ValueError, AttributeError):
+            models = {}
+
+        self.loaded[self.path] = (mtime, models)
+        return models
+
+    def update(self, game: str, model: str, log: Path, diagnostics: List[Diagnostic]):
+        '''Replace the diagnostics of a model with those of its latest compile.'''
+        with self.lock:
+            models = dict(self.load())
+            models[f'{game}|{model}'] = {
+                'game': game,
+                'model': model,
+                'log': str(log),
+                'time': time.time(),
+                'diagnostics': [diagnostic.to_dict() for diagnostic in diagnostics],
+            }
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.path.with_suffix('.tmp')
+
+            with temp.open('w', encoding='utf-8') as file:
+                json.dump({'models': models}, file, indent=4)
+
+            os.replace(temp, self.path)
+            self.loaded[self.path] = (self.path.stat().st_mtime_ns, models)
+
+    def records(self, game: str = None, severity: str = 'ALL', search: str = '', sort: str = 'MODEL') -> List[dict]:
+        '''Get diagnostics as flat records with their model, filtered and sorted.'''
+        records = []
+        search = search.lower()
+
+        for entry in self.load().values():
+            if game and entry.get('game') != game:
+                continue
+
+            for diagnostic in entry.get('diagnostics', []):
+                record = dict(diagnostic, model=entry.get('model', ''), log=entry.get('log', ''))
+
+                if severity != 'ALL' and record['severity'] != severity:
+                    continue
+
+                if search and not any(search in str(record.get(key, '')).lower() for key in ('model', 'message', 'smd', 'material')):
+                    continue
+
+                records.append(record)
+
+        if sort == 'SEVERITY':
+            records.sort(key=lambda record: (record['severity'] != 'ERROR', record['model'], record['line']))
+        elif sort == 'MESSAGE':
+            records.sort(key=lambda record: (record['message'].lower(), record['model']))
+        else:
+            records.sort(key=lambda record: (record['model'], record['line']))
+
+        return records
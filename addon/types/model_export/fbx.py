@@ -1,106 +1,203 @@
 import bpy
+import numpy
 from bpy.types import Bone, Object, PoseBone, TriangulateModifier
 from mathutils import Matrix
 from pathlib import Path
 from typing import List
+from ... utils.scene_state import SceneState, scene_state
+from . smd import MeshCache, Settings, read_mesh
+from . import fbx_binary
+from . fbx_scene import Scene, global_settings
 
 
 MESH_TYPES = {'CURVE', 'FONT', 'MESH', 'SURFACE'}
 OBJECT_TYPES = MESH_TYPES | {'ARMATURE'}
 
+# The Blender exporter is called with this scale, so one Blender unit in the default metric system is one Source unit.
+GLOBAL_SCALE = 0.01
 
-def export_fbx(path: Path, armature: Object, objects: List[Object], prepend_armature: bool, ignore_transforms: bool):
-    '''Export objects to FBX with settings for Source.'''
-    frame_current = bpy.context.scene.frame_current
-    bpy.context.scene.frame_current = bpy.context.scene.frame_start
 
-    collection = bpy.data.collections.new('SourceOps')
-    bpy.context.scene.collection.children.link(collection)
+def unit_scales(scene: bpy.types.Scene) -> tuple:
+    '''Get the geometry scale and FBX unit scale the Blender exporter writes with, for the settings it's called with here.
+    It applies the unit settings and scales with FBX_SCALE_NONE, so both go into the transforms and the FBX unit scale stays at 1.0.
+    Without a unit system it counts a Blender unit as one FBX unit, a centimeter, otherwise as the scale length in meters.'''
+    units = 1.0 if scene.unit_settings.system == 'NONE' else 100.0 * scene.unit_settings.scale_length
+    return units * GLOBAL_SCALE, 1.0
 
-    active_layer_collection = bpy.context.view_layer.active_layer_collection
-    bpy.context.view_layer.active_layer_collection = bpy.context.view_layer.layer_collection.children[-1]
 
-    if armature and armature.animation_data and armature.animation_data.action:
-        action = armature.animation_data.action
-        armature.animation_data_clear()
+class FBXExport:
+    '''Scene changes for exporting the FBX files of one model, made once for every body and undone with the scene state.
+    Each body is exported by linking its objects into the export collection, so only the exporter itself runs per body.'''
 
-        for pose_bone in armature.pose.bones:
-            pose_bone: PoseBone
-            bone: Bone = pose_bone.bone
-            pose_bone.matrix = bone.matrix_local
-    else:
-        action = None
+    def __init__(self, state: SceneState, armature: Object, prepend_armature: bool, ignore_transforms: bool):
+        self.state = state
+        self.armature = armature
+        self.prepend_armature = prepend_armature
+        self.ignore_transforms = ignore_transforms
+        self.collection = None
+        self.prepared = set()
 
-    obj_hide_viewport = {}
-    obj_matrix_local = {}
-    obj_matrix_parent_inverse = {}
-    bone_name = {}
-    obj_triangulate_mod = {}
+    def begin(self):
+        state = self.state
+        scene = bpy.context.scene
+        view_layer = bpy.context.view_layer
+        state.set(scene, 'frame_current', scene.frame_start)
 
-    if armature:
-        objects.append(armature)
+        self.collection = state.new_collection('SourceOps')
+        state.set(view_layer, 'active_layer_collection', view_layer.layer_collection.children[-1])
+
+        armature = self.armature
+
+        if armature and armature.animation_data and armature.animation_data.action:
+            action = armature.animation_data.action
+            armature.animation_data_clear()
+            state.defer(lambda: setattr(armature.animation_data_create(), 'action', action))
+
+            for pose_bone in armature.pose.bones:
+                pose_bone: PoseBone
+                bone: Bone = pose_bone.bone
+                pose_bone.matrix = bone.matrix_local
+
+    def prepare(self, obj: Object):
+        '''Get an object ready for export, the first time it's used by any body.'''
+        if obj in self.prepared:
+            return
+
+        self.prepared.add(obj)
+        state = self.state
 
-    for obj in set(objects):
         if obj.type in OBJECT_TYPES:
-            collection.objects.link(obj)
-            obj_hide_viewport[obj] = obj.hide_viewport
-            obj.hide_viewport = False
+            state.set(obj, 'hide_viewport', False)
 
-            if ignore_transforms:
-                obj_matrix_local[obj] = obj.matrix_local.copy()
-                obj.matrix_local = Matrix.Identity(4)
-                obj_matrix_parent_inverse[obj] = obj.matrix_parent_inverse.copy()
-                obj.matrix_parent_inverse = Matrix.Identity(4)
+            if self.ignore_transforms:
+                state.set(obj, 'matrix_local', Matrix.Identity(4))
+                state.set(obj, 'matrix_parent_inverse', Matrix.Identity(4))
 
         if obj.type == 'ARMATURE':
-            if prepend_armature:
+            if self.prepend_armature:
                 for bone in obj.data.bones:
-                    bone_name[bone] = bone.name
-                    bone.name = f'{obj.name}.{bone.name}'
+                    state.set(bone, 'name', f'{obj.name}.{bone.name}')
 
         if obj.type in MESH_TYPES:
             mod: TriangulateModifier = obj.modifiers.new('Triangulate', 'TRIANGULATE')
-            obj_triangulate_mod[obj] = mod
+            state.defer(lambda: obj.modifiers.remove(mod))
             mod.min_vertices = 4
             mod.quad_method = 'FIXED'
             mod.ngon_method = 'CLIP'
             if hasattr(mod, 'keep_custom_normals'):
                 mod.keep_custom_normals = True
 
-    try:
-        bpy.ops.export_scene.fbx(
-            filepath=str(path),
-            use_active_collection=True,
-            global_scale=0.01,
-            add_leaf_bones=False,
-            bake_anim=False,
-        )
+    def export(self, path: Path, objects: List[Object]):
+        '''Export the objects of one body, with the armature if there is one.'''
+        objects = set(objects)
+
+        if self.armature:
+            objects.add(self.armature)
+
+        linked = []
+
+        try:
+            for obj in objects:
+                self.prepare(obj)
+
+                if obj.type in OBJECT_TYPES:
+                    self.collection.objects.link(obj)
+                    linked.append(obj)
+
+            bpy.ops.export_scene.fbx(
+                filepath=str(path),
+                use_active_collection=True,
+                global_scale=GLOBAL_SCALE,
+                add_leaf_bones=False,
+                bake_anim=False,
+            )
+
+        finally:
+            for obj in linked:
+                self.collection.objects.unlink(obj)
+
+
+def export_fbx(path: Path, armature: Object, objects: List[Object], prepend_armature: bool, ignore_transforms: bool, state: SceneState = None):
+    '''Export objects to FBX with settings for Source.'''
+    with scene_state(state) as state:
+        export = FBXExport(state, armature, prepend_armature, ignore_transforms)
+        export.begin()
+        export.export(path, objects)
+
+
+def export_fbx_native(path: Path, armature: Object, objects: List[Object], prepend_armature: bool, ignore_transforms: bool, triangulation: str = 'MODIFIER', meshes: MeshCache = None, state: SceneState = None):
+    '''Export objects to FBX with the built in writer, from the same mesh arrays as SMD files.
+    Only hidden objects and edit mode are changed for the export, the rest of the scene is left alone.'''
+    settings = Settings(prepend_armature, ignore_transforms, triangulation=triangulation)
+    scene = Scene(*unit_scales(bpy.context.scene))
+    bones = {}
+
+    if armature:
+        for index, bone in enumerate(armature.data.bones):
+            bones[bone.name] = index
+
+        skeleton = []
+
+        for bone in armature.data.bones:
+            bone: Bone
+            name = f'{armature.name}.{bone.name}' if prepend_armature else bone.name
+            parent = bones[bone.parent.name] if bone.parent else -1
+            skeleton.append((name, parent, numpy.array(bone.matrix_local, dtype=numpy.float64)))
+
+        matrix = numpy.identity(4) if ignore_transforms else numpy.array(armature.matrix_world, dtype=numpy.float64)
+        scene.add_armature(armature.name, matrix, skeleton)
+
+    with scene_state(state) as state:
+        state.object_mode()
+
+        for obj in objects:
+            state.show(obj)
+
+        state.update()
+
+        for obj in objects:
+            if obj.type not in MESH_TYPES:
+                continue
+
+            groups = bool(armature and obj.vertex_groups)
+            data = meshes.get(settings, obj, groups) if meshes else read_mesh(settings, obj, groups)
+            weights = None
+
+            if armature:
+                remap = numpy.array([bones.get(group.name, -1) for group in obj.vertex_groups], dtype=numpy.int32)
+
+                # Weights of groups the object doesn't have are dropped, like groups without a bone.
+                indices = numpy.full(len(data.groups), -1, dtype=numpy.int32)
+                known = data.groups < len(remap)
+                indices[known] = remap[data.groups[known]]
+                keep = indices != -1
+                owners = numpy.repeat(numpy.arange(len(data.group_counts), dtype=numpy.int32), data.group_counts)[keep]
+
+                offsets = numpy.zeros(len(data.group_counts) + 1, dtype=numpy.int32)
+                numpy.cumsum(numpy.bincount(owners, minlength=len(data.group_counts)), out=offsets[1:])
+                weights = (offsets, indices[keep], data.weights[keep])
+
+            scene.add_mesh(obj.name, data.positions, data.vertex_indices, data.normals, data.uvs, data.material_indices, data.materials, weights)
 
-    except:
-        raise
+    scene.write(path)
 
-    finally:
-        for obj, triangulate_mod in obj_triangulate_mod.items():
-            obj.modifiers.remove(triangulate_mod)
 
-        if prepend_armature:
-            for bone, name in bone_name.items():
-                bone.name = name
+def compare_writers(path: Path, armature: Object, objects: List[Object], prepend_armature: bool, ignore_transforms: bool) -> List[str]:
+    '''Write the same objects with both writers next to path, and list the global settings of the native file that differ.
+    Only the settings the native writer writes are compared, an empty list means it matches the Blender exporter.'''
+    native = path.with_name(f'{path.stem}.native.fbx')
+    blender = path.with_name(f'{path.stem}.blender.fbx')
 
-        if ignore_transforms:
-            for obj, matrix_parent_inverse in obj_matrix_parent_inverse.items():
-                obj.matrix_parent_inverse = matrix_parent_inverse
+    export_fbx_native(native, armature, objects, prepend_armature, ignore_transforms)
+    export_fbx(blender, armature, objects, prepend_armature, ignore_transforms)
 
-            for obj, matrix_local in obj_matrix_local.items():
-                obj.matrix_local = matrix_local
+    expected = global_settings(fbx_binary.read(blender))
+    differences = []
 
-        for obj, hide_viewport in obj_hide_viewport.items():
-            obj.hide_viewport = hide_viewport
+    for name, values in global_settings(fbx_binary.read(native)).items():
+        other = expected.get(name)
 
-        if action:
-            armature.animation_data_create()
-            armature.animation_data.action = action
+        if other is None or len(other) != len(values) or not numpy.allclose(values, other, rtol=1e-6, atol=0):
+            differences.append(f'{name}: {values} instead of {other}')
 
-        bpy.context.view_layer.active_layer_collection = active_layer_collection
-        bpy.data.collections.remove(collection)
-        bpy.context.scene.frame_current = frame_current
+    return differences
@@ -0,0 +1,207 @@
+import zlib
+import numpy
+from pathlib import Path
+from struct import Struct
+from typing import List
+
+
+# The file id and creation time are a pair the FBX SDK accepts, and so is the footer id, they are the ones Blender writes too.
+HEADER = b'Kaydara FBX Binary  \x00\x1a\x00'
+FILE_ID = b'\x28\xb3\x2a\xeb\xb6\x24\xcc\xc2\xbf\xc8\xb0\x2a\xa9\x2b\xfc\xf1'
+FOOTER_ID = b'\xfa\xbc\xab\x09\xd0\xc8\xd4\x66\xb1\x76\xfb\x83\x1c\xf7\x26\x7e'
+FOOTER_END = b'\xf8\x5a\x8c\x6a\xde\xf5\xd9\x7e\xec\xe9\x0c\xe3\x75\x8f\x29\x0b'
+CREATION_TIME = '1970-01-01 10:00:00:000'
+
+# Version 7.4 uses 32 bit offsets, which is plenty for models studiomdl can compile.
+VERSION = 7400
+RECORD = Struct('<3I')
+NULL_RECORD = bytes(RECORD.size + 1)
+
+SCALARS = {'C': Struct('<?'), 'Y': Struct('<h'), 'I': Struct('<i'), 'L': Struct('<q'), 'F': Struct('<f'), 'D': Struct('<d')}
+ARRAYS = {'b': numpy.bool_, 'i': numpy.int32, 'l': numpy.int64, 'f': numpy.float32, 'd': numpy.float64}
+SIZE = Struct('<I')
+ARRAY = Struct('<3I')
+
+# Arrays smaller than this many bytes are stored as is, compressing them isn't worth it.
+COMPRESS_SIZE = 128
+
+
+class Node:
+    '''An FBX node with a name, typed properties and child nodes.
+    Properties are pairs of an FBX type code and a value, arrays are NumPy arrays.'''
+
+    def __init__(self, name: str, *properties: tuple):
+        self.name = name
+        self.properties = list(properties)
+        self.children: List[Node] = []
+
+    def add(self, name: str, *properties: tuple) -> 'Node':
+        child = Node(name, *properties)
+        self.children.append(child)
+        return child
+
+    def find(self, name: str) -> 'Node':
+        return next((child for child in self.children if child.name == name), None)
+
+    def find_all(self, name: str) -> List['Node']:
+        return [child for child in self.children if child.name == name]
+
+    def values(self) -> list:
+        return [value for _, value in self.properties]
+
+    def encode(self, buffer: bytearray):
+        '''Append this node to the file buffer, offsets are positions in the whole file.'''
+        start = len(buffer)
+        name = self.name.encode()
+        buffer += RECORD.pack(0, len(self.properties), 0)
+        buffer += bytes((len(name),)) + name
+
+        properties = len(buffer)
+
+        for code, value in self.properties:
+            encode_property(buffer, code, value)
+
+        size = len(buffer) - properties
+
+        for child in self.children:
+            child.encode(buffer)
+
+        # A nested list ends with a null record, and so does a node with nothing in it.
+        if self.children or not self.properties:
+            buffer += NULL_RECORD
+
+        RECORD.pack_into(buffer, start, len(buffer), len(self.properties), size)
+
+
+def encode_property(buffer: bytearray, code: str, value):
+    buffer += code.encode()
+
+    if code in SCALARS:
+        buffer += SCALARS[code].pack(value)
+
+    elif code in ('S', 'R'):
+        data = value.encode() if isinstance(value, str) else bytes(value)
+        buffer += SIZE.pack(len(data)) + data
+
+    elif code in ARRAYS:
+        data = numpy.ascontiguousarray(value, dtype=ARRAYS[code]).tobytes()
+        length = len(value)
+
+        if len(data) >= COMPRESS_SIZE:
+            data = zlib.compress(data, 1)
+            buffer += ARRAY.pack(length, 1, len(data)) + data
+        else:
+            buffer += ARRAY.pack(length, 0, len(data)) + data
+
+    else:
+        raise ValueError(f'Unknown FBX property type: {code}')
+
+
+def encode(nodes: List[Node]) -> bytearray:
+    '''Serialize top level nodes into a whole FBX file.'''
+    buffer = bytearray(HEADER)
+    buffer += SIZE.pack(VERSION)
+
+    for node in nodes:
+        node.encode(buffer)
+
+    buffer += NULL_RECORD
+    buffer += FOOTER_ID
+    buffer += bytes(4)
+
+    # The footer is aligned to 16 bytes, with a full block of padding when it already is.
+    padding = (16 - len(buffer) % 16) or 16
+    buffer += bytes(padding)
+
+    buffer += SIZE.pack(VERSION)
+    buffer += bytes(120)
+    buffer += FOOTER_END
+    return buffer
+
+
+def write(path: Path, nodes: List[Node]):
+    with open(path, 'wb') as file:
+        file.write(encode(nodes))
+
+
+def decode_property(data: bytes, offset: int) -> tuple:
+    code = chr(data[offset])
+    offset += 1
+
+    if code in SCALARS:
+        scalar = SCALARS[code]
+        return (code, scalar.unpack_from(data, offset)[0]), offset + scalar.size
+
+    if code in ('S', 'R'):
+        size = SIZE.unpack_from(data, offset)[0]
+        offset += SIZE.size
+        value = data[offset:offset + size]
+        return (code, value.decode(errors='replace') if code == 'S' else bytes(value)), offset + size
+
+    if code in ARRAYS:
+        length, encoding, size = ARRAY.unpack_from(data, offset)
+        offset += ARRAY.size
+        value = data[offset:offset + size]
+
+        if encoding == 1:
+            value = zlib.decompress(value)
+
+        return (code, numpy.frombuffer(value, dtype=ARRAYS[code], count=length).copy()), offset + size
+
+    raise ValueError(f'Unknown FBX property type: {code}')
+
+
+def decode_node(data: bytes, offset: int) -> tuple:
+    '''Read the node at offset, returns None for a null record and the offset after it.'''
+    end, count, _ = RECORD.unpack_from(data, offset)
+    offset += RECORD.size
+
+    if end == 0:
+        return None, offset + 1
+
+    length = data[offset]
+    offset += 1
+    node = Node(data[offset:offset + length].decode())
+    offset += length
+
+    for _ in range(count):
+        property, offset = decode_property(data, offset)
+        node.properties.append(property)
+
+    while offset < end:
+        child, offset = decode_node(data, offset)
+
+        if child is None:
+            break
+
+        node.children.append(child)
+
+    return node, end
+
+
+def decode(data: bytes) -> List[Node]:
+    '''Parse a whole binary FBX file into its top level nodes.'''
+    if not data.startswith(HEADER[:20]):
+        raise ValueError('Not a binary FBX file')
+
+    version = SIZE.unpack_from(data, len(HEADER))[0]
+    if version >= 7500:
+        raise ValueError(f'Unsupported FBX version: {version}')
+
+    nodes = []
+    offset = len(HEADER) + SIZE.size
+
+    while offset < len(data):
+        node, offset = decode_node(data, offset)
+
+        if node is None:
+            break
+
+        nodes.append(node)
+
+    return nodes
+
+
+def read(path: Path) -> List[Node]:
+    with open(path, 'rb') as file:
+        return decode(file.read())
@@ -0,0 +1,286 @@
+import numpy
+from pathlib import Path
+from typing import List
+from . import fbx_binary
+from . fbx_binary import Node
+
+
+# Blender is Z up and Y forward, FBX files for studiomdl are Y up and -Z forward, same as the Blender exporter writes.
+AXES = numpy.array([[1, 0, 0, 0], [0, 0, 1, 0], [0, -1, 0, 0], [0, 0, 0, 1]], dtype=numpy.float64)
+
+
+def fbx_name(name: str, kind: str) -> str:
+    return f'{name}\x00\x01{kind}'
+
+
+def fbx_matrix(matrix: numpy.ndarray) -> numpy.ndarray:
+    '''Flatten a 4x4 matrix in the column major order FBX uses.'''
+    return numpy.ascontiguousarray(matrix, dtype=numpy.float64).T.ravel()
+
+
+def decompose(matrix: numpy.ndarray) -> tuple:
+    '''Split a matrix into translation, XYZ euler rotation in degrees and scale.'''
+    translation = matrix[:3, 3]
+    scale = numpy.linalg.norm(matrix[:3, :3], axis=0)
+
+    if numpy.linalg.det(matrix[:3, :3]) < 0:
+        scale[0] = -scale[0]
+
+    rotation = matrix[:3, :3] / numpy.where(scale == 0, 1, scale)
+    y = numpy.arcsin(numpy.clip(-rotation[2, 0], -1, 1))
+
+    if abs(numpy.cos(y)) > 1e-6:
+        x = numpy.arctan2(rotation[2, 1], rotation[2, 2])
+        z = numpy.arctan2(rotation[1, 0], rotation[0, 0])
+    else:
+        x = numpy.arctan2(-rotation[1, 2], rotation[1, 1])
+        z = 0.0
+
+    return translation, numpy.degrees([x, y, z]), scale
+
+
+def add_property(properties: Node, name: str, kind: str, label: str, flags: str, *values: tuple):
+    properties.add('P', ('S', name), ('S', kind), ('S', label), ('S', flags), *values)
+
+
+def add_transform(properties: Node, matrix: numpy.ndarray):
+    translation, rotation, scale = decompose(matrix)
+    add_property(properties, 'Lcl Translation', 'Lcl Translation', '', 'A', *(('D', float(value)) for value in translation))
+    add_property(properties, 'Lcl Rotation', 'Lcl Rotation', '', 'A', *(('D', float(value)) for value in rotation))
+    add_property(properties, 'Lcl Scaling', 'Lcl Scaling', '', 'A', *(('D', float(value)) for value in scale))
+
+
+def global_settings(nodes: List[Node]) -> dict:
+    '''Get the properties of the GlobalSettings in the nodes of a decoded file, by name.'''
+    settings = next((node for node in nodes if node.name == 'GlobalSettings'), None)
+    properties = settings.find('Properties70') if settings else None
+
+    if not properties:
+        return {}
+
+    return {values[0]: tuple(values[4:]) for values in (node.values() for node in properties.find_all('P'))}
+
+
+class Scene:
+    '''The objects and connections of one FBX file, with only what studiomdl reads: meshes, materials, skeleton and skin weights.
+    Matrices and positions are in Blender space, they are converted to FBX axes and scaled by the geometry scale here.
+    The unit scale is only written to the global settings, like the geometry scale both come from the Blender exporter's settings.'''
+
+    def __init__(self, scale: float = 1.0, unit_scale: float = 1.0):
+        self.axes = AXES @ numpy.diag([scale, scale, scale, 1.0])
+        self.unit_scale = unit_scale
+        self.objects = Node('Objects')
+        self.connections = Node('Connections')
+        self.counts = {}
+        self.last_id = 1000000
+
+        self.materials = {}
+        self.armature = None
+        self.bone_ids = []
+        self.bone_names = []
+        self.bone_matrices = []
+        self.pose = []
+
+    def new_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def connect(self, child: int, parent: int):
+        self.connections.add('C', ('S', 'OO'), ('L', child), ('L', parent))
+
+    def add_object(self, kind: str, name: str, subtype: str) -> tuple:
+        '''Add an object node of a kind like Model or Geometry, counted for the definitions.'''
+        id = self.new_id()
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        node = self.objects.add(kind, ('L', id), ('S', fbx_name(name, 'SubDeformer' if subtype == 'Cluster' else kind)), ('S', subtype))
+        return id, node
+
+    def add_model(self, name: str, subtype: str, local: numpy.ndarray, parent: int) -> int:
+        id, node = self.add_object('Model', name, subtype)
+        node.add('Version', ('I', 232))
+        add_transform(node.add('Properties70'), local)
+        node.add('Shading', ('C', True))
+        node.add('Culling', ('S', 'CullingOff'))
+        self.connect(id, parent)
+        return id
+
+    def add_armature(self, name: str, matrix: numpy.ndarray, bones: List[tuple]):
+        '''Add an armature as an empty with bones under it, bones are tuples of name, parent index and armature space matrix.'''
+        world = self.axes @ matrix
+        self.armature = self.add_model(name, 'Null', world, 0)
+        self.pose.append((self.armature, world))
+
+        for name, parent, local in bones:
+            if parent < 0:
+                parent_id, parent_world = self.armature, world
+            else:
+                parent_id, parent_world = self.bone_ids[parent], self.bone_matrices[parent]
+
+            bone_world = world @ local
+            id = self.add_model(name, 'LimbNode', numpy.linalg.inv(parent_world) @ bone_world, parent_id)
+
+            attribute, node = self.add_object('NodeAttribute', name, 'LimbNode')
+            node.add('TypeFlags', ('S', 'Skeleton'))
+            self.connect(attribute, id)
+
+            self.bone_ids.append(id)
+            self.bone_names.append(name)
+            self.bone_matrices.append(bone_world)
+            self.pose.append((id, bone_world))
+
+    def add_material(self, name: str) -> int:
+        if name not in self.materials:
+            id, node = self.add_object('Material', name, '')
+            node.add('Version', ('I', 102))
+            node.add('ShadingModel', ('S', 'phong'))
+            node.add('MultiLayer', ('I', 0))
+            add_property(node.add('Properties70'), 'DiffuseColor', 'ColorRGB', 'Color', '', ('D', 0.8), ('D', 0.8), ('D', 0.8))
+            self.materials[name] = id
+
+        return self.materials[name]
+
+    def add_mesh(self, name: str, positions: numpy.ndarray, vertex_indices: numpy.ndarray, normals: numpy.ndarray, uvs: numpy.ndarray,
+                 material_indices: numpy.ndarray, materials: List[str], weights: tuple = None):
+        '''Add a triangulated mesh, with per corner vertex indices, normals and UVs, and a material index per triangle.
+        Weights are CSR arrays of offsets per vertex, bone indices and values.'''
+        rotation = AXES[:3, :3]
+        id = self.add_model(name, 'Mesh', numpy.identity(4), 0)
+        self.pose.append((id, numpy.identity(4)))
+
+        geometry, node = self.add_object('Geometry', name, 'Mesh')
+        self.connect(geometry, id)
+
+        polygons = numpy.array(vertex_indices, dtype=numpy.int32).reshape(-1, 3)
+        polygons[:, 2] = ~polygons[:, 2]
+
+        node.add('Vertices', ('d', (positions @ self.axes[:3, :3].T).ravel()))
+        node.add('PolygonVertexIndex', ('i', polygons.ravel()))
+        node.add('GeometryVersion', ('I', 124))
+
+        layer = node.add('LayerElementNormal', ('I', 0))
+        layer.add('Version', ('I', 101))
+        layer.add('Name', ('S', ''))
+        layer.add('MappingInformationType', ('S', 'ByPolygonVertex'))
+        layer.add('ReferenceInformationType', ('S', 'Direct'))
+        layer.add('Normals', ('d', (normals @ rotation.T).ravel()))
+
+        layer = node.add('LayerElementUV', ('I', 0))
+        layer.add('Version', ('I', 101))
+        layer.add('Name', ('S', 'UVMap'))
+        layer.add('MappingInformationType', ('S', 'ByPolygonVertex'))
+        layer.add('ReferenceInformationType', ('S', 'IndexToDirect'))
+        layer.add('UV', ('d', uvs.ravel()))
+        layer.add('UVIndex', ('i', numpy.arange(len(uvs), dtype=numpy.int32)))
+
+        # Material indices refer to the materials in the order they are connected to the model.
+        used, indices = numpy.unique(material_indices, return_inverse=True)
+
+        layer = node.add('LayerElementMaterial', ('I', 0))
+        layer.add('Version', ('I', 101))
+        layer.add('Name', ('S', ''))
+        layer.add('MappingInformationType', ('S', 'ByPolygon'))
+        layer.add('ReferenceInformationType', ('S', 'IndexToDirect'))
+        layer.add('Materials', ('i', indices))
+
+        layer = node.add('Layer', ('I', 0))
+        layer.add('Version', ('I', 100))
+
+        for element in ('LayerElementNormal', 'LayerElementMaterial', 'LayerElementUV'):
+            typed = layer.add('LayerElement')
+            typed.add('Type', ('S', element))
+            typed.add('TypedIndex', ('I', 0))
+
+        for index in used:
+            self.connect(self.add_material(materials[index]), id)
+
+        if weights and self.armature:
+            self.add_skin(name, geometry, *weights)
+
+    def add_skin(self, name: str, geometry: int, offsets: numpy.ndarray, bones: numpy.ndarray, values: numpy.ndarray):
+        skin, node = self.add_object('Deformer', '', 'Skin')
+        node.add('Version', ('I', 101))
+        node.add('Link_DeformAcuracy', ('D', 50.0))
+        self.connect(skin, geometry)
+
+        vertices = numpy.repeat(numpy.arange(len(offsets) - 1, dtype=numpy.int32), offsets[1:] - offsets[:-1])
+        order = numpy.argsort(bones, kind='stable')
+        vertices, bones, values = vertices[order], bones[order], values[order]
+        used, starts = numpy.unique(bones, return_index=True)
+
+        for bone, start, end in zip(used, starts, list(starts[1:]) + [len(bones)]):
+            matrix = self.bone_matrices[bone]
+            cluster, node = self.add_object('Deformer', self.bone_names[bone], 'Cluster')
+            node.add('Version', ('I', 100))
+            node.add('UserData', ('S', ''), ('S', ''))
+            node.add('Indexes', ('i', vertices[start:end]))
+            node.add('Weights', ('d', values[start:end]))
+            node.add('Transform', ('d', fbx_matrix(numpy.linalg.inv(matrix))))
+            node.add('TransformLink', ('d', fbx_matrix(matrix)))
+            self.connect(cluster, skin)
+            self.connect(self.bone_ids[bone], cluster)
+
+    def add_pose(self):
+        id, node = self.add_object('Pose', 'BindPose', 'BindPose')
+        node.add('Type', ('S', 'BindPose'))
+        node.add('Version', ('I', 100))
+        node.add('NbPoseNodes', ('I', len(self.pose)))
+
+        for model, matrix in self.pose:
+            pose_node = node.add('PoseNode')
+            pose_node.add('Node', ('L', model))
+            pose_node.add('Matrix', ('d', fbx_matrix(matrix)))
+
+    def nodes(self) -> List[Node]:
+        if self.armature:
+            self.add_pose()
+
+        header = Node('FBXHeaderExtension')
+        header.add('FBXHeaderVersion', ('I', 1003))
+        header.add('FBXVersion', ('I', fbx_binary.VERSION))
+        header.add('EncryptionType', ('I', 0))
+        header.add('Creator', ('S', 'SourceOps'))
+
+        settings = Node('GlobalSettings')
+        settings.add('Version', ('I', 1000))
+        properties = settings.add('Properties70')
+
+        for name, value in (('UpAxis', 1), ('UpAxisSign', 1), ('FrontAxis', 2), ('FrontAxisSign', 1), ('CoordAxis', 0), ('CoordAxisSign', 1), ('OriginalUpAxis', 2), ('OriginalUpAxisSign', 1)):
+            add_property(properties, name, 'int', 'Integer', '', ('I', value))
+
+        # With the settings the Blender exporter is called with, its units go into the geometry and this stays at 1.0.
+        add_property(properties, 'UnitScaleFactor', 'double', 'Number', '', ('D', self.unit_scale))
+        add_property(properties, 'OriginalUnitScaleFactor', 'double', 'Number', '', ('D', self.unit_scale))
+
+        documents = Node('Documents')
+        documents.add('Count', ('I', 1))
+        document = documents.add('Document', ('L', self.new_id()), ('S', ''), ('S', 'Scene'))
+        add_property(document.add('Properties70'), 'SourceObject', 'object', '', '')
+        document.add('RootNode', ('L', 0))
+
+        definitions = Node('Definitions')
+        definitions.add('Version', ('I', 100))
+        definitions.add('Count', ('I', sum(self.counts.values()) + 1))
+        definitions.add('ObjectType', ('S', 'GlobalSettings')).add('Count', ('I', 1))
+
+        for kind, count in self.counts.items():
+            definitions.add('ObjectType', ('S', kind)).add('Count', ('I', count))
+
+        takes = Node('Takes')
+        takes.add('Current', ('S', ''))
+
+        return [
+            header,
+            Node('FileId', ('R', fbx_binary.FILE_ID)),
+            Node('CreationTime', ('S', fbx_binary.CREATION_TIME)),
+            Node('Creator', ('S', 'SourceOps')),
+            settings,
+            documents,
+            Node('References'),
+            definitions,
+            self.objects,
+            self.connections,
+            takes,
+        ]
+
+    def write(self, path: Path):
+        fbx_binary.write(path, self.nodes())
@@ -0,0 +1,276 @@
+import bpy
+import json
+import numpy
+from hashlib import blake2b
+from pathlib import Path
+from typing import List
+
+
+MESH_TYPES = {'CURVE', 'FONT', 'MESH', 'SURFACE'}
+
+
+class Fingerprint:
+    '''Hash of everything that goes into one exported file.
+    Objects whose data can't be hashed make the fingerprint invalid, so that file is always exported.'''
+
+    # Bump this when the exporters write different output for the same input.
+    VERSION = 1
+
+    def __init__(self, *settings):
+        self.hash = blake2b(digest_size=16)
+        self.valid = True
+        self.update(self.VERSION, *settings)
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest() if self.valid else None
+
+    def update(self, *values):
+        for value in values:
+            if isinstance(value, numpy.ndarray):
+                self.hash.update(value.dtype.str.encode())
+                self.hash.update(value.tobytes())
+            else:
+                self.hash.update(repr(value).encode())
+
+            self.hash.update(b'\0')
+
+    def array(self, collection, attribute: str, width: int = 1, dtype=numpy.float32):
+        '''Hash an attribute of every item in a Blender collection.'''
+        values = numpy.empty(len(collection) * width, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        self.update(attribute, values)
+
+    def rna(self, struct: bpy.types.bpy_struct):
+        '''Hash every property of a struct, and the data its pointers lead to.'''
+        for prop in struct.bl_rna.properties:
+            if prop.identifier == 'rna_type' or prop.type == 'COLLECTION':
+                continue
+
+            value = getattr(struct, prop.identifier, None)
+
+            if prop.type == 'POINTER':
+                self.update(prop.identifier)
+                self.dependency(value)
+                continue
+
+            if isinstance(value, set):
+                value = tuple(sorted(value))
+            elif hasattr(value, '__len__') and not isinstance(value, str):
+                value = tuple(value)
+
+            self.update(prop.identifier, value)
+
+        # Geometry nodes keep their inputs as custom properties.
+        if hasattr(struct, 'keys'):
+            for key in struct.keys():
+                value = struct[key]
+                self.update(key, getattr(value, 'name', None) or (value.to_list() if hasattr(value, 'to_list') else value))
+
+    def dependency(self, pointer):
+        '''Hash data that a modifier or constraint reads from elsewhere.'''
+        if isinstance(pointer, bpy.types.Object):
+            self.update(pointer.name, tuple(map(tuple, pointer.matrix_world)))
+
+            if pointer.type == 'MESH':
+                self.array(pointer.data.vertices, 'co', 3)
+                self.array(pointer.data.loops, 'vertex_index', 1, numpy.int32)
+
+        # Node groups and collections can depend on anything, don't try to follow them.
+        elif isinstance(pointer, (bpy.types.Collection, bpy.types.NodeTree)):
+            self.valid = False
+
+        else:
+            self.update(getattr(pointer, 'name', None))
+
+    def object(self, object: bpy.types.Object, ignore_transforms: bool):
+        self.update(object.name, object.type)
+
+        if object.type not in MESH_TYPES:
+            return
+
+        if not ignore_transforms:
+            self.update(tuple(map(tuple, object.matrix_world)))
+
+        for modifier in getattr(object, 'modifiers', []):
+            self.update(modifier.type)
+            self.rna(modifier)
+
+        if object.type == 'MESH':
+            self.mesh(object, object.data)
+        else:
+            self.valid = False
+
+    def mesh(self, object: bpy.types.Object, mesh: bpy.types.Mesh):
+        self.update(mesh.name, [slot.material.name if slot.material else None for slot in object.material_slots])
+        self.update([group.name for group in object.vertex_groups])
+
+        self.array(mesh.vertices, 'co', 3)
+        self.array(mesh.edges, 'vertices', 2, numpy.int32)
+        self.array(mesh.polygons, 'loop_total', 1, numpy.int32)
+        self.array(mesh.polygons, 'material_index', 1, numpy.int32)
+        self.array(mesh.polygons, 'use_smooth', 1, bool)
+        self.array(mesh.loops, 'vertex_index', 1, numpy.int32)
+
+        for layer in mesh.uv_layers:
+            self.update(layer.name, layer.active_render)
+            self.array(layer.data, 'uv', 2)
+
+        # Newer versions keep sharp edges, sharp faces and the like as attributes.
+        for attribute in getattr(mesh, 'attributes', []):
+            self.update(attribute.name, attribute.data_type, attribute.domain)
+
+            if attribute.data_type == 'STRING' or not len(attribute.data):
+                continue
+
+            for name in ('value', 'vector', 'color'):
+                if hasattr(attribute.data[0], name):
+                    sample = numpy.asarray(getattr(attribute.data[0], name))
+                    dtype = {'b': bool, 'i': numpy.int32, 'u': numpy.int32}.get(sample.dtype.kind, numpy.float32)
+                    self.array(attribute.data, name, sample.size, dtype)
+                    break
+
+        # Older versions keep sharp edges as a flag instead of an attribute.
+        if 'sharp_edge' not in getattr(mesh, 'attributes', []) and 'use_edge_sharp' in bpy.types.MeshEdge.bl_rna.properties:
+            self.array(mesh.edges, 'use_edge_sharp', 1, bool)
+
+        if hasattr(mesh, 'use_auto_smooth'):
+            self.update(mesh.use_auto_smooth, mesh.auto_smooth_angle)
+
+        # Custom normals aren't a generic attribute in every version, the normals they produce are hashed instead.
+        self.update(mesh.has_custom_normals)
+
+        if hasattr(mesh, 'corner_normals'):
+            self.array(mesh.corner_normals, 'vector', 3)
+        else:
+            mesh.calc_normals_split()
+            self.array(mesh.loops, 'normal', 3)
+
+        if mesh.shape_keys:
+            for block in mesh.shape_keys.key_blocks:
+                self.update(block.name, block.value, block.mute)
+                self.array(block.data, 'co', 3)
+
+        # Weights have no bulk access, they are hashed per vertex like the exporter reads them.
+        if object.vertex_groups:
+            self.update([[(group.group, group.weight) for group in vertex.groups] for vertex in mesh.vertices])
+
+    def armature(self, armature: bpy.types.Object, ignore_transforms: bool):
+        self.update(armature.name)
+
+        if not ignore_transforms:
+            self.update(tuple(map(tuple, armature.matrix_world)))
+
+        bones = armature.data.bones
+        self.update([(bone.name, bone.parent.name if bone.parent else None) for bone in bones])
+        self.array(bones, 'matrix_local', 16)
+
+    def action(self, armature: bpy.types.Object, action: bpy.types.Action):
+        self.update(action.name, tuple(action.frame_range))
+
+        for fcurve in getattr(action, 'fcurves', None) or []:
+            self.update(fcurve.data_path, fcurve.array_index, fcurve.mute, fcurve.extrapolation)
+            self.array(fcurve.keyframe_points, 'co', 2)
+            self.array(fcurve.keyframe_points, 'handle_left', 2)
+            self.array(fcurve.keyframe_points, 'handle_right', 2)
+            self.update([point.interpolation for point in fcurve.keyframe_points])
+
+            for modifier in fcurve.modifiers:
+                self.rna(modifier)
+
+        if not hasattr(action, 'fcurves'):
+            self.valid = False
+
+        # Scene sampling also picks up constraints, drivers and NLA tracks.
+        for pose_bone in armature.pose.bones:
+            for constraint in pose_bone.constraints:
+                self.rna(constraint)
+
+        animation_data = armature.animation_data
+
+        if animation_data and (animation_data.drivers or animation_data.nla_tracks):
+            self.valid = False
+
+
+class Manifest:
+    '''Fingerprints of the files of one model export, stored next to the QC.
+    A file is only exported again when its fingerprint changed, or it was changed or removed on disk.'''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}
+
+        try:
+            with self.path.open('r') as file:
+                self.entries = json.load(file).get('outputs', {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def key(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.path.parent).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def stat(self, path: Path) -> list:
+        stat = path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_current(self, path: Path, fingerprint: str) -> bool:
+        '''Check whether a file was exported with this fingerprint and hasn't been touched since.'''
+        entry = self.entries.get(self.key(path))
+
+        if not fingerprint or not entry or entry['fingerprint'] != fingerprint:
+            return False
+
+        try:
+            return self.stat(path) == entry['stat']
+        except OSError:
+            return False
+
+    def update(self, path: Path, fingerprint: str):
+        if fingerprint:
+            self.entries[self.key(path)] = {'fingerprint': fingerprint, 'stat': self.stat(path)}
+        else:
+            self.entries.pop(self.key(path), None)
+
+    def discard(self, path: Path):
+        self.entries.pop(self.key(path), None)
+
+    def save(self):
+        with self.path.open('w') as file:
+            json.dump({'version': Fingerprint.VERSION, 'outputs': self.entries}, file, indent=4, sort_keys=True)
+
+
+def fingerprint_mesh(settings: tuple, armature: bpy.types.Object, objects: List[bpy.types.Object], ignore_transforms: bool, frame: int) -> str:
+    '''Fingerprint a body, made from these objects and weighted to this armature, evaluated at this frame.'''
+    fingerprint = Fingerprint('MESH', *settings)
+
+    if armature:
+        fingerprint.armature(armature, ignore_transforms)
+
+    for object in objects:
+        fingerprint.object(object, ignore_transforms)
+
+        # Animated modifiers and shape keys are exported at the frame the exporter evaluates.
+        if object.animation_data or getattr(getattr(object.data, 'shape_keys', None), 'animation_data', None):
+            fingerprint.update(frame)
+
+    return fingerprint.hexdigest()
+
+
+def fingerprint_anim(settings: tuple, armature: bpy.types.Object, action: bpy.types.Action, ignore_transforms: bool) -> str:
+    '''Fingerprint a sequence, this action played on this armature.'''
+    fingerprint = Fingerprint('ANIM', *settings)
+
+    if armature:
+        fingerprint.armature(armature, ignore_transforms)
+
+        if action:
+            fingerprint.action(armature, action)
+
+    return fingerprint.hexdigest()
+
+
+def fingerprint_qc(text: str) -> str:
+    '''Fingerprint a generated QC, which is all of its text.'''
+    return Fingerprint('QC', text).hexdigest()
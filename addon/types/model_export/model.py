@@ -2,19 +2,29 @@ import bpy
 import time
 import subprocess
 import os
-from math import degrees
-from shutil import move
+from threading import Timer
 from pathlib import Path
 from traceback import print_exc
 from ... utils import common
-from . smd import SMD
-from . fbx import export_fbx
+from ... utils import wine
+from ... utils.scene_state import SceneState
+from . smd import SMD, ArmatureCache, MeshCache
+from . serialize import Pool
+from . manifest import Manifest, fingerprint_anim, fingerprint_mesh, fingerprint_qc
+from . fbx import FBXExport, export_fbx_native, unit_scales
+from . compile_cache import CompileCache
+from . qc import build_qc, render_qc
+from . publish import SUFFIXES, Publisher, detach
+from . compile_log import CompileLog, DiagnosticsIndex
 
 
 class Model:
     def __init__(self, game, model):
         self.prefs = common.get_prefs(bpy.context)
         self.wine = Path(self.prefs.wine)
+        self.wine_prefix = Path(self.prefs.wine_prefix) if self.prefs.wine_prefix else None
+        self.compile_cache = self.prefs.compile_cache
+        self.link_outputs = self.prefs.link_outputs
 
         self.game = Path(game.game)
         self.bin = Path(game.bin)
@@ -25,6 +35,16 @@ class Model:
         self.models = Path(game.models)
         self.mapsrc = Path(game.mapsrc)
         self.mesh_type = game.mesh_type
+        self.fbx_writer = game.fbx_writer
+        self.buffer_size = 1 << 20
+        self.cache = None
+        self.pool = None
+        self.own_pool = False
+        self.smd_jobs = []
+        self.manifest = None
+        self.qc_text = None
+        self.process = None
+        self.cancelled = False
 
         self.name = Path(model.name).with_suffix('').as_posix()
         self.stem = common.clean_filename(Path(self.name).stem)
@@ -64,6 +84,10 @@ class Model:
 
         self.prepend_armature = model.prepend_armature
         self.ignore_transforms = model.ignore_transforms
+        self.limit_weights = model.limit_weights
+        self.sampling = model.sampling
+        self.triangulation = model.triangulation
+        self.skip_unchanged = model.skip_unchanged
 
         self.origin_source = model.origin_source
         self.origin_object = model.origin_object
@@ -74,78 +98,186 @@ class Model:
         self.rotation = model.rotation
         self.scale = model.scale
 
-    def export_meshes(self):
+    def export_meshes(self, pool=None):
+        '''Export every body and sequence, SMDs are written by the given pool, or by one made for this model.'''
         self.ensure_modelsrc_folder()
         # self.remove_modelsrc_old()  # Commented out because it might be annoying.
 
-        if not self.sequence_items:
-            self.export_anim(self.armature, None, self.directory.joinpath('anims', 'idle.SMD'))
+        self.manifest = Manifest(self.directory.joinpath(f'{self.stem}.manifest.json'))
 
-        for sequence in self.sequence_items:
-            path = self.directory.joinpath('anims', f'{common.clean_filename(sequence.name)}.SMD')
-            self.export_anim(self.armature, sequence.action, path)
+        # Every SMD of this export shares the bone table, nodes and rest pose of the armature, and the evaluated meshes.
+        self.cache = ArmatureCache()
+        self.meshes = MeshCache()
 
-        if self.reference:
-            objects = self.get_all_objects(self.reference)
-            path = self.get_body_path(self.reference)
-            self.export_mesh(self.armature, objects, path)
+        # Blender data is read here, SMD text is formatted and written by worker processes.
+        # Exporting many models shares one pool, so its workers only start once.
+        self.pool = pool or Pool()
+        self.own_pool = pool is None
+        self.smd_jobs = []
 
-        if self.collision:
-            objects = self.get_all_objects(self.collision)
-            path = self.get_body_path(self.collision)
+        # Scene changes are made once for every body, and undone together when the export ends or fails.
+        self.state = SceneState()
+        self.fbx = None
+        self.fingerprints = {}
+
+        try:
+            with self.state:
+                # Edit mode data is only up to date in object mode, which is the only change made before fingerprinting.
+                self.state.object_mode()
+                self.fingerprint_outputs()
+                self.sample_sequences()
+                self.export_bodies()
+        finally:
+            self.fbx = None
+            self.finish_smds()
+            self.save_manifest()
+
+    def export_bodies(self):
+        for path, action in self.get_anims():
+            self.export_anim(self.armature, action, path)
+
+        for path, objects in self.get_bodies():
             self.export_mesh(self.armature, objects, path)
 
+    def fingerprint_outputs(self):
+        '''Fingerprint every file before the export changes the scene, so fingerprints only depend on the data and settings.'''
+        for path, action in self.get_anims():
+            self.fingerprints[path] = self.get_anim_fingerprint(self.armature, action)
+
+        for path, objects in self.get_bodies():
+            self.fingerprints[path] = self.get_mesh_fingerprint(self.armature, objects)
+
+    def get_anims(self):
+        if not self.sequence_items:
+            return [(self.directory.joinpath('anims', 'idle.SMD'), None)]
+
+        return [(self.get_anim_path(sequence), sequence.action) for sequence in self.sequence_items]
+
+    def get_bodies(self):
+        collections = [self.reference, self.collision]
+
         if self.bodygroups:
             for bodygroup in self.bodygroups.children:
-                for collection in bodygroup.children:
-                    objects = self.get_all_objects(collection)
-                    path = self.get_body_path(collection)
-                    self.export_mesh(self.armature, objects, path)
+                collections.extend(bodygroup.children)
 
         if self.stacking:
-            for collection in self.stacking.children:
-                objects = self.get_all_objects(collection)
-                path = self.get_body_path(collection)
-                self.export_mesh(self.armature, objects, path)
+            collections.extend(self.stacking.children)
+
+        return [(self.get_body_path(collection), self.get_all_objects(collection)) for collection in collections if collection]
+
+    def sample_sequences(self):
+        actions = []
+
+        for path, action in self.get_anims():
+            if action and not self.is_unchanged(path, self.fingerprints.get(path)):
+                actions.append(action)
+
+        if self.armature and actions:
+            smd = SMD(self.prepend_armature, self.ignore_transforms, self.limit_weights, self.sampling, cache=self.cache, state=self.state)
+            smd.sample(self.armature, actions)
 
     def export_anim(self, armature, action, path):
-        self.export_smd(armature, [], action, path)
+        fingerprint = self.fingerprints.get(path)
+
+        if self.is_unchanged(path, fingerprint):
+            return print(f'Skipped: {path} (unchanged)')
+
+        self.export_smd(armature, [], action, path, fingerprint)
 
     def export_mesh(self, armature, objects, path):
+        fingerprint = self.fingerprints.get(path)
+
+        if self.is_unchanged(path, fingerprint):
+            return print(f'Skipped: {path} (unchanged)')
+
         if self.mesh_type == 'SMD':
-            self.export_smd(armature, objects, None, path)
+            self.export_smd(armature, objects, None, path, fingerprint)
         elif self.mesh_type == 'FBX':
-            self.export_fbx(armature, objects, path)
+            self.export_fbx(armature, objects, path, fingerprint)
 
-    def export_smd(self, armature, objects, action, path):
-        try:
-            smd_file = path.open('w')
-        except:
-            self.report(f'Failed to export: {path}', exception=True)
-        else:
-            start = time.time()
+    def export_smd(self, armature, objects, action, path, fingerprint=None):
+        start = time.time()
 
-            smd = SMD(self.prepend_armature, self.ignore_transforms)
-            smd.from_blender(armature, objects, action)
+        smd = SMD(self.prepend_armature, self.ignore_transforms, self.limit_weights, self.sampling, self.triangulation, cache=self.cache, meshes=self.meshes, state=self.state)
+        smd.from_blender(armature, objects, action)
 
-            smd_file.write(smd.to_string())
-            smd_file.close()
+        future = self.pool.submit(smd.buffers, path, self.buffer_size)
+        self.smd_jobs.append((path, start, future, fingerprint))
 
-            print(f'Exported: {path} in {round(time.time() - start, 1)} seconds')
+    def finish_smds(self):
+        if self.own_pool:
+            self.pool.shutdown()
+        else:
+            self.pool.drain()
+
+        for path, start, future, fingerprint in self.smd_jobs:
+            try:
+                future.result()
+            except:
+                self.manifest.discard(path)
+                self.report(f'Failed to export: {path}', exception=True)
+            else:
+                self.manifest.update(path, fingerprint)
+                print(f'Exported: {path} in {round(time.time() - start, 1)} seconds')
 
-    def export_fbx(self, armature, objects, path):
+        self.smd_jobs = []
+
+    def export_fbx(self, armature, objects, path, fingerprint=None):
         start = time.time()
 
         try:
-            export_fbx(path, armature, objects, self.prepend_armature, self.ignore_transforms)
+            if self.fbx_writer == 'NATIVE':
+                export_fbx_native(path, armature, objects, self.prepend_armature, self.ignore_transforms, self.triangulation, self.meshes, self.state)
+
+            else:
+                if not self.fbx:
+                    self.fbx = FBXExport(self.state, armature, self.prepend_armature, self.ignore_transforms)
+                    self.fbx.begin()
+
+                self.fbx.export(path, objects)
         except:
+            self.manifest.discard(path)
             self.report(f'Failed to export: {path}', exception=True)
         else:
+            self.manifest.update(path, fingerprint)
             print(f'Exported: {path} in {round(time.time() - start, 1)} seconds')
 
+    def get_export_settings(self):
+        return (self.mesh_type, self.prepend_armature, self.ignore_transforms, self.limit_weights, self.sampling)
+
+    def get_anim_fingerprint(self, armature, action):
+        if self.skip_unchanged:
+            return fingerprint_anim(self.get_export_settings(), armature, action, self.ignore_transforms)
+
+    def get_mesh_fingerprint(self, armature, objects):
+        if self.skip_unchanged:
+            scene = bpy.context.scene
+
+            # The Blender FBX exporter runs at the start frame, the others at the current frame.
+            if self.mesh_type == 'FBX' and self.fbx_writer == 'BLENDER':
+                frame = scene.frame_start
+            else:
+                frame = scene.frame_current
+
+            # Both FBX writers scale the geometry by the unit settings of the scene.
+            units = unit_scales(scene) if self.mesh_type == 'FBX' else None
+            return fingerprint_mesh(self.get_export_settings() + (self.triangulation, self.fbx_writer, units), armature, objects, self.ignore_transforms, frame)
+
+    def is_unchanged(self, path, fingerprint):
+        return self.manifest.is_current(path, fingerprint)
+
+    def save_manifest(self):
+        try:
+            self.manifest.save()
+        except:
+            self.report(f'Failed to save: {self.manifest.path}', exception=True)
+
     def get_all_objects(self, collection):
         return common.remove_duplicates(collection.all_objects) if collection else []
 
+    def get_anim_path(self, sequence):
+        return self.directory.joinpath('anims', f'{common.clean_filename(sequence.name)}.SMD')
+
     def get_body_path(self, collection):
         name = common.clean_filename(collection.name)
         return self.directory.joinpath(f'{name}.{self.mesh_type}')
@@ -160,234 +292,160 @@ class Model:
 
         self.ensure_modelsrc_folder()
         path = self.directory.joinpath(f'{self.stem}.qc')
+        self.qc_text = render_qc(build_qc(self, bpy.context.scene.render.fps))
+
+        # Leave an identical QC alone, so its modification time only changes with its contents.
+        # The manifest knows the hash it was written with, so the QC isn't read back to compare.
+        manifest = self.manifest or Manifest(self.directory.joinpath(f'{self.stem}.manifest.json'))
+        fingerprint = fingerprint_qc(self.qc_text)
+
+        if manifest.is_current(path, fingerprint):
+            return print(f'Unchanged: {path}')
 
         try:
-            qc = path.open('w')
             print(f'Generating: {path}')
+            path.write_text(self.qc_text)
         except:
-            return self.report(f'Failed to open: {path}', exception=True)
-
-        qc.write(f'$modelname "{self.name}"')
-        qc.write('\n')
-
-        if not self.material_folder_items:
-            qc.write('\n')
-            qc.write('$cdmaterials "/"')
-            qc.write('\n')
-
-        for material_folder in self.material_folder_items:
-            qc.write('\n')
-            qc.write(f'$cdmaterials "{material_folder.name}"')
-            qc.write('\n')
-
-        qc.write('\n')
-        qc.write(f'$surfaceprop "{self.surface}"')
-        qc.write('\n')
-
-        if self.glass:
-            qc.write('\n')
-            qc.write('$mostlyopaque')
-            qc.write('\n')
-
-        if self.static:
-            qc.write('\n')
-            qc.write('$staticprop')
-            qc.write('\n')
-
-        if self.origin_source == 'MANUAL':
-            origin_x = self.origin_x
-            origin_y = self.origin_y
-            origin_z = self.origin_z
-            rotation = -self.rotation
-        elif self.origin_source == 'OBJECT' and self.origin_object:
-            loc, rot, _ = self.origin_object.matrix_world.decompose()
-            origin_x = loc.x
-            origin_y = loc.y
-            origin_z = loc.z
-            rotation = -degrees(rot.to_euler().z)
-        else:
-            origin_x = 0
-            origin_y = 0
-            origin_z = 0
-            rotation = 0
-
-        if self.static and self.mesh_type == 'FBX':
-            origin_x, origin_y = -origin_y, origin_x
-            rotation -= 180
-        else:
-            rotation -= 90
-
-        # The origin command does not work with static prop combine.
-        if not (self.static and self.static_prop_combine):
-            qc.write('\n')
-            qc.write(f'$origin {origin_x:.6f} {origin_y:.6f} {origin_z:.6f} {rotation:.6f}')
-            qc.write('\n')
-
-        qc.write('\n')
-        qc.write(f'$scale {self.scale:.6f}')
-        qc.write('\n')
-
-        if self.reference:
-            qc.write('\n')
-            name = common.clean_filename(self.reference.name)
-            qc.write(f'$body "{name}" "{name}.{self.mesh_type}"')
-            qc.write('\n')
-
-        if not self.rename_material == '':
-            qc.write('\n')
-            qc.write(f'$renamematerial {self.rename_material}')
-            qc.write('\n')
-
-        if self.collision:
-            qc.write('\n')
-            name = common.clean_filename(self.collision.name)
-            command = 'collisionjoints' if self.joints else 'collisionmodel'
-            qc.write(f'${command} "{name}.{self.mesh_type}"' + ' {\n')
-            command = 'concaveperjoint' if self.joints else 'concave'
-            qc.write(f'    ${command}\n')
-            command = f'mass {self.mass}' if self.mass > 0 else 'automass'
-            qc.write(f'    ${command}\n')
-            qc.write('    $maxconvexpieces 10000\n')
-            qc.write('}')
-            qc.write('\n')
+            return self.report(f'Failed to write: {path}', exception=True)
 
-        if self.bodygroups:
-            for bodygroup in self.bodygroups.children:
-                qc.write('\n')
-                bodygroup_name = common.clean_filename(bodygroup.name)
-                qc.write(f'$bodygroup "{bodygroup_name}"' + ' {\n')
-                for collection in bodygroup.children:
-                    name = common.clean_filename(collection.name)
-                    qc.write(f'    studio "{name}.{self.mesh_type}"\n')
-                qc.write('}')
-                qc.write('\n')
+        manifest.update(path, fingerprint)
 
-        if self.stacking:
-            for collection in self.stacking.children:
-                qc.write('\n')
-                name = common.clean_filename(collection.name)
-                qc.write(f'$model "{name}" "{name}.{self.mesh_type}"')
-                qc.write('\n')
+        try:
+            manifest.save()
+        except:
+            self.report(f'Failed to save: {manifest.path}', exception=True)
 
-        if not self.sequence_items:
-            qc.write('\n')
-            qc.write(f'$sequence "idle" "anims/idle.SMD"')
-            qc.write('\n')
-
-        for sequence in self.sequence_items:
-            qc.write('\n')
-            qc.write(f'$sequence "{sequence.name}"' + ' {\n')
-            qc.write(f'    "anims/{common.clean_filename(sequence.name)}.SMD"\n')
-            if sequence.use_framerate:
-                qc.write(f'    fps {sequence.framerate}\n')
-            else:
-                qc.write(f'    fps {bpy.context.scene.render.fps}\n')
-            if sequence.use_range:
-                qc.write(f'    frames {sequence.start} {sequence.end}\n')
-            if sequence.snap:
-                qc.write('    snap\n')
-            if sequence.loop:
-                qc.write('    loop\n')
-            qc.write(f'    activity "{sequence.activity}" {sequence.weight}\n')
-            for event in sequence.event_items:
-                qc.write('    { ' + f'event "{event.event}" {event.frame} "{event.value}"' + ' }\n')
-            qc.write('}')
-            qc.write('\n')
-
-        for attachment in self.attachment_items:
-            if self.armature and attachment.bone:
-                qc.write('\n')
-                qc.write(f'$attachment "{attachment.name}"')
-                if self.prepend_armature:
-                    qc.write(f' "{self.armature.name}.{attachment.bone}"')
-                else:
-                    qc.write(f' "{attachment.bone}"')
-                qc.write(f' {attachment.offset[0]} {attachment.offset[1]} {attachment.offset[2]}')
-                if attachment.absolute:
-                    qc.write(' absolute')
-                if attachment.rigid:
-                    qc.write(' rigid')
-                qc.write(f' rotate {attachment.rotation[0]} {attachment.rotation[1]} {attachment.rotation[2]}')
-                qc.write('\n')
-
-        if self.skin_items:
-            qc.write('\n')
-            qc.write('$texturegroup "skinfamilies"')
-            qc.write('\n')
-            qc.write('{')
-
-            for skin in self.skin_items:
-                qc.write('\n')
-                qc.write(f'    {{ {skin.name} }}')
-
-            qc.write('\n')
-            qc.write('}')
-            qc.write('\n')
-        
-        if(len(self.particle_items) > 0):
-            qc.write('\n')      
-            qc.write('$keyvalues')
-            qc.write('\n')
-            qc.write('{')
-            qc.write('\n')
-            qc.write('    particles')
-            qc.write('\n')
-            qc.write('    {')
-            
-            for index, particle in enumerate(self.particle_items):
-                qc.write('\n')
-                qc.write(f'        "effect{index}"')
-                qc.write('\n        {\n')
-                qc.write(f'            "name" "{particle.name}"')
-                qc.write('\n')
-                qc.write(f'            "attachment_type" "{particle.attachment_type}"')
-                qc.write('\n')
-                if(particle.attachment_point):
-                    qc.write(f'            "attachment_point" "{particle.attachment_point}"')
-                    qc.write('\n')
-                qc.write('        }\n')
-            
-            qc.write('    }')
-            qc.write('\n')
-            qc.write('}')
-        
-        qc.close()
-
-    def compile_qc(self):
+    def compile_qc(self, timeout=None):
         qc = self.directory.joinpath(f'{self.stem}.qc')
         if qc.is_file():
-            print(f'Compiling: {qc}')
+            cache = CompileCache(qc, self.models.joinpath(self.name), self.get_artifacts_folder(), self.link_outputs, self.qc_text)
+            cache.compute(self.studiomdl, self.game, self.name)
+
+            if cache.is_current():
+                print(f'Skipped: {qc} (unchanged)')
+                return
+
+            # The current model stays in place until the new one is published, even if compiling fails.
             self.ensure_models_folder()
-            self.remove_models_old()
-
-            # Use wine to run StudioMDL on Linux.
-            # Wine tends to complain about the paths we feed StudioMDL.
-            # So we use relatve paths working from the base directory of the game.
-            if (os.name == 'posix') and (self.studiomdl.suffix == '.exe'):
-                cwd = self.game.parent
-                args = [str(self.wine), str(self.studiomdl.relative_to(cwd)), '-nop4', '-fullcollide',
-                        '-game', str(self.game.relative_to(cwd)), str(qc.relative_to(cwd))]
-            else:
-                cwd = None
-                args = [str(self.studiomdl), '-nop4', '-fullcollide', '-game', str(self.game), str(qc)]
+            self.remove_compiled_old()
 
-            pipe = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+            try:
+                if cache.restore():
+                    print(f'Restored: {qc} from the compile cache')
+                    return
+            except:
+                self.report(f'Failed to restore: {qc} from the compile cache', exception=True)
 
-            while True:
-                code = pipe.returncode
-                if code is None:
-                    log = self.directory.joinpath(f'{self.stem}.log')
-                    log.write_bytes(b'\n\n\n'.join(pipe.communicate()))
-                else:
-                    break
+            # Studiomdl writes straight over the current model when it compiles into the models folder, keep a backup to put back.
+            try:
+                backup = self.preserve_compiled()
+            except:
+                return self.report(f'Failed to back up the compiled model of: {qc}', exception=True)
 
-            if code == 0:
-                self.move_files()
-            else:
-                return self.report(f'Failed to compile: {qc}')
+            succeeded = False
+
+            try:
+                error = self.run_studiomdl(qc, cache, timeout)
+                succeeded = not error
+                return error
+            finally:
+                if backup and succeeded:
+                    backup.commit()
+                elif backup:
+                    backup.rollback()
         else:
             return self.report(f'Unable to find: {qc}')
 
+    def run_studiomdl(self, qc, cache, timeout=None):
+        print(f'Compiling: {qc}')
+
+        # Use wine to run StudioMDL on Linux.
+        # Wine tends to complain about the paths we feed StudioMDL.
+        # So we use relatve paths working from the base directory of the game.
+        if (os.name == 'posix') and (self.studiomdl.suffix == '.exe'):
+            cwd = self.game.parent
+            args = [str(self.studiomdl.relative_to(cwd)), '-nop4', '-fullcollide',
+                    '-game', str(self.game.relative_to(cwd)), str(qc.relative_to(cwd))]
+            pipe = self.get_wine_session().popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd)
+        else:
+            cwd = None
+            args = [str(self.studiomdl), '-nop4', '-fullcollide', '-game', str(self.game), str(qc)]
+            pipe = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd)
+
+        self.process = pipe
+
+        if self.cancelled:
+            pipe.kill()
+
+        expired = []
+
+        def expire():
+            expired.append(timeout)
+            pipe.kill()
+
+        def diagnose(diagnostic):
+            print(f'{qc.name}: {diagnostic}')
+
+            # Studiomdl errors are fatal, stop now instead of letting it run to the end.
+            if diagnostic.severity == 'ERROR' and pipe.poll() is None:
+                pipe.kill()
+
+        timer = Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+
+        log = CompileLog(self.directory.joinpath(f'{self.stem}.log'))
+
+        try:
+            log.read(pipe.stdout, diagnose)
+        except:
+            pipe.kill()
+            raise
+        finally:
+            code = pipe.wait()
+            pipe.stdout.close()
+
+            if timer:
+                timer.cancel()
+
+        if self.cancelled:
+            return self.report(f'Cancelled compiling: {qc}')
+
+        try:
+            index = DiagnosticsIndex(common.cache_folder().joinpath('diagnostics.json'))
+            index.update(str(self.game), self.name, log.path, log.diagnostics)
+        except:
+            self.report(f'Failed to index diagnostics of: {qc}', exception=True)
+
+        if expired:
+            return self.report(f'Timed out compiling: {qc} after {timeout} seconds')
+
+        if log.errors:
+            return self.report(f'Failed to compile: {qc} ({log.errors[0].message})')
+
+        if code == 0:
+            error = self.move_files()
+            if error:
+                return error
+
+            try:
+                cache.store()
+            except:
+                self.report(f'Failed to cache: {qc}', exception=True)
+        else:
+            return self.report(f'Failed to compile: {qc}')
+
+    def cancel_compile(self) -> bool:
+        '''Stop a compile running on another thread, it then returns an error.
+        Returns True only when a running studiomdl was killed, a compile that is restoring from the cache or publishing may still finish.'''
+        self.cancelled = True
+
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            return True
+
+        return False
+
     def open_folder(self):
         try:
             print(f'Opening: {self.directory}')
@@ -405,36 +463,53 @@ class Model:
         # So we use relatve paths working from the base directory of the game.
         if (os.name == 'posix') and (self.studiomdl.suffix == '.exe'):
             cwd = self.game.parent
-            args = [str(self.wine), str(self.hlmv.relative_to(cwd)), '-game',
+            args = [str(self.hlmv.relative_to(cwd)), '-game',
                     str(self.game.relative_to(cwd)), str(mdl.relative_to(cwd))]
+            popen = self.get_wine_session().popen
         else:
             cwd = None
             args = [str(self.hlmv), '-game', str(self.game), str(mdl)]
+            popen = subprocess.Popen
 
         if dx90.is_file():
             print(f'Viewing: {mdl}')
-            subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+            popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
         else:
             return self.report(f'Failed to view: {mdl}')
 
+    def get_wine_session(self):
+        return wine.get_session(self.wine, self.wine_prefix)
+
     def move_files(self):
         path_src = self.game.joinpath('models', self.name)
         path_dst = self.models.joinpath(self.name)
 
+        # Compiled in place, the backup made by preserve_compiled is committed or rolled back instead.
         if path_src == path_dst:
             return
 
-        print(f'Moving to: {self.models}')
+        print(f'Publishing to: {self.models}')
         common.verify_folder(path_dst.parent)
+        publisher = Publisher(path_dst, self.link_outputs)
 
-        for suffix in ('.dx90.vtx', '.dx80.vtx', '.sw.vtx', '.vvd', '.mdl', '.phy'):
-            src = path_src.with_suffix(suffix)
-            dst = path_dst.with_suffix(suffix)
+        try:
+            publisher.stage(path_src)
+            publisher.publish()
+        except:
+            publisher.discard()
+            return self.report(f'Failed to move {path_src} to {path_dst}', exception=True)
 
-            try:
-                move(src, dst)
-            except:
-                self.report(f'Failed to move {src} to {dst}', exception=True)
+    def preserve_compiled(self):
+        '''Back up the current model when studiomdl compiles over it in place, returns the publisher to roll back or commit with.'''
+        path_src = self.game.joinpath('models', self.name)
+        path_dst = self.models.joinpath(self.name)
+
+        if path_src != path_dst:
+            return None
+
+        publisher = Publisher(path_dst, self.link_outputs)
+        publisher.preserve()
+        return publisher
 
     def ensure_modelsrc_folder(self):
         self.directory.mkdir(parents=True, exist_ok=True)
@@ -446,16 +521,26 @@ class Model:
                 if file.is_file():
                     file.unlink()
 
+    def get_artifacts_folder(self):
+        if self.compile_cache:
+            return common.cache_folder().joinpath('models')
+
     def ensure_models_folder(self):
         destination = self.models.joinpath(self.name).parent
         destination.mkdir(parents=True, exist_ok=True)
 
-    def remove_models_old(self):
-        model = self.models.joinpath(self.name)
-        for suffix in ('.dx90.vtx', '.dx80.vtx', '.sw.vtx', '.vvd', '.mdl', '.phy'):
-            path = model.with_suffix(suffix)
-            if path.is_file():
-                path.unlink()
+    def remove_compiled_old(self):
+        path_src = self.game.joinpath('models', self.name)
+        path_dst = self.models.joinpath(self.name)
+
+        if path_src != path_dst:
+            for suffix in SUFFIXES:
+                path = path_src.with_suffix(suffix)
+                if path.is_file():
+                    path.unlink()
+
+        elif self.link_outputs:
+            detach(path_dst)
 
     def report(self, message, exception=False):
         print(message)
@@ -0,0 +1,147 @@
+import os
+import shutil
+from pathlib import Path
+
+
+# The .mdl comes last, so the game never loads a new .mdl next to old .vvd and .vtx files.
+SUFFIXES = ('.dx90.vtx', '.dx80.vtx', '.sw.vtx', '.vvd', '.phy', '.mdl')
+
+
+def transfer(src: Path, dst: Path, keep: bool = False, link: bool = False):
+    '''Put a file at a new path that doesn't exist yet.
+    Kept files are hard linked when asked and on the same filesystem, copied otherwise, the rest is moved.'''
+    if not keep:
+        shutil.move(str(src), str(dst))
+        return
+
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+
+
+def detach(model: Path):
+    '''Give hard linked outputs their own copy, so a program writing into them doesn't change the other links.'''
+    for suffix in SUFFIXES:
+        path = model.with_suffix(suffix)
+
+        if path.is_file() and path.stat().st_nlink > 1:
+            temp = path.with_name(f'.{path.name}.tmp')
+            shutil.copy2(path, temp)
+            os.replace(temp, path)
+
+
+class Publisher:
+    '''Gather the compiled files of a model in a staging folder next to their destination, then swap them in.
+    Each file is replaced with its own rename, so the model as a whole is not replaced atomically. The files it replaces are
+    kept in a backup folder until every file is in, and put back when one fails, or by the next publish after an interruption.'''
+
+    def __init__(self, model: Path, link: bool = False):
+        self.model = model
+        self.link = link
+        self.staging = model.parent.joinpath(f'.{model.name}.staging')
+        self.backup = model.parent.joinpath(f'.{model.name}.backup')
+        self.trash = model.parent.joinpath(f'.{model.name}.trash')
+
+    def staged(self, suffix: str) -> Path:
+        return self.staging.joinpath(self.model.name).with_suffix(suffix)
+
+    def backed_up(self, suffix: str) -> Path:
+        return self.backup.joinpath(self.model.name).with_suffix(suffix)
+
+    def added(self, suffix: str) -> Path:
+        '''An empty file that marks a file the old model didn't have, so rolling back removes it.'''
+        return self.backup.joinpath(f'{self.model.name}{suffix}.added')
+
+    def stage(self, source: Path, keep: bool = False):
+        '''Take the compiled files at source, which is a path without suffix like the model.'''
+        self.discard()
+        self.staging.mkdir(parents=True)
+
+        for suffix in SUFFIXES:
+            src = source.with_suffix(suffix)
+
+            if src.is_file():
+                transfer(src, self.staged(suffix), keep, self.link)
+
+        if not self.staged('.mdl').is_file():
+            raise FileNotFoundError(f'No compiled model at: {source.with_suffix(".mdl")}')
+
+    def publish(self):
+        '''Swap the staged files in, and remove files of the old model that the new one doesn't have.
+        When a file can't be swapped in, the files replaced before it are put back and the error is raised.'''
+        self.rollback()
+        shutil.rmtree(self.trash, ignore_errors=True)
+        self.backup.mkdir(parents=True)
+        stale = []
+
+        try:
+            for suffix in SUFFIXES:
+                src = self.staged(suffix)
+                dst = self.model.with_suffix(suffix)
+
+                if src.is_file():
+                    # The backup is a hard link when possible, so the old file stays in place until the rename.
+                    if dst.is_file():
+                        transfer(dst, self.backed_up(suffix), keep=True, link=True)
+                    else:
+                        self.added(suffix).touch()
+
+                    os.replace(src, dst)
+
+                elif dst.is_file():
+                    stale.append(suffix)
+
+            # Files the new model doesn't have go to the backup as well, so rolling back brings them back too.
+            for suffix in stale:
+                os.replace(self.model.with_suffix(suffix), self.backed_up(suffix))
+
+        except:
+            self.rollback()
+            raise
+
+        self.commit()
+        self.discard()
+
+    def preserve(self):
+        '''Back up the model before something writes over it in place, rolling back then puts it back.
+        The backup is a copy, since the writer may reuse the files instead of replacing them.'''
+        self.rollback()
+        shutil.rmtree(self.trash, ignore_errors=True)
+        self.backup.mkdir(parents=True)
+
+        for suffix in SUFFIXES:
+            dst = self.model.with_suffix(suffix)
+
+            if dst.is_file():
+                transfer(dst, self.backed_up(suffix), keep=True)
+            else:
+                self.added(suffix).touch()
+
+    def commit(self):
+        '''Keep the new model and drop the backup.'''
+        # Moving the backup away is what completes the publish, a half removed backup would be rolled back later.
+        os.replace(self.backup, self.trash)
+        shutil.rmtree(self.trash, ignore_errors=True)
+
+    def rollback(self):
+        '''Put back the old model from the backup of a failed or interrupted publish, if there is one.'''
+        if not self.backup.is_dir():
+            return
+
+        for suffix in reversed(SUFFIXES):
+            dst = self.model.with_suffix(suffix)
+
+            if self.backed_up(suffix).is_file():
+                os.replace(self.backed_up(suffix), dst)
+            elif self.added(suffix).is_file() and dst.is_file():
+                dst.unlink()
+
+        shutil.rmtree(self.backup)
+
+    def discard(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
@@ -0,0 +1,189 @@
+from math import degrees
+from typing import List
+from ... utils import common
+
+
+class Command:
+    '''A line of a QC file, with an optional block of commands in braces.
+    Blocks open on the same line, unless the braces go on their own lines, and can have empty lines between their commands.'''
+
+    def __init__(self, *tokens, block: list = None, own_line: bool = False, spaced: bool = False, end: str = '\n'):
+        self.tokens = [str(token) for token in tokens]
+        self.block = block
+        self.own_line = own_line
+        self.spaced = spaced
+        self.end = end
+
+    def render(self, parts: list, indent: str = ''):
+        line = ' '.join(self.tokens)
+
+        if self.block is None:
+            parts.append(f'{indent}{line}{self.end}')
+            return
+
+        if self.own_line:
+            parts.append(f'{indent}{line}\n{indent}{{\n')
+        else:
+            parts.append(f'{indent}{line} {{\n')
+
+        for index, command in enumerate(self.block):
+            if index and self.spaced:
+                parts.append('\n')
+
+            command.render(parts, indent + '    ')
+
+        parts.append(f'{indent}}}{self.end}')
+
+
+def quote(value) -> str:
+    return f'"{value}"'
+
+
+def render_qc(document: List[Command]) -> str:
+    '''Serialize a QC document into one string, with an empty line between commands.'''
+    parts = []
+
+    for index, command in enumerate(document):
+        if index:
+            parts.append('\n')
+
+        command.render(parts)
+
+    return ''.join(parts)
+
+
+def get_origin(model) -> tuple:
+    if model.origin_source == 'MANUAL':
+        origin_x = model.origin_x
+        origin_y = model.origin_y
+        origin_z = model.origin_z
+        rotation = -model.rotation
+    elif model.origin_source == 'OBJECT' and model.origin_object:
+        loc, rot, _ = model.origin_object.matrix_world.decompose()
+        origin_x = loc.x
+        origin_y = loc.y
+        origin_z = loc.z
+        rotation = -degrees(rot.to_euler().z)
+    else:
+        origin_x = 0
+        origin_y = 0
+        origin_z = 0
+        rotation = 0
+
+    if model.static and model.mesh_type == 'FBX':
+        origin_x, origin_y = -origin_y, origin_x
+        rotation -= 180
+    else:
+        rotation -= 90
+
+    return origin_x, origin_y, origin_z, rotation
+
+
+def build_qc(model, fps: int) -> List[Command]:
+    '''Build the QC document of a model, fps is used for sequences without their own framerate.'''
+    document = [Command('$modelname', quote(model.name))]
+
+    if not model.material_folder_items:
+        document.append(Command('$cdmaterials', quote('/')))
+
+    for material_folder in model.material_folder_items:
+        document.append(Command('$cdmaterials', quote(material_folder.name)))
+
+    document.append(Command('$surfaceprop', quote(model.surface)))
+
+    if model.glass:
+        document.append(Command('$mostlyopaque'))
+
+    if model.static:
+        document.append(Command('$staticprop'))
+
+    # The origin command does not work with static prop combine.
+    if not (model.static and model.static_prop_combine):
+        document.append(Command('$origin', *(f'{value:.6f}' for value in get_origin(model))))
+
+    document.append(Command('$scale', f'{model.scale:.6f}'))
+
+    if model.reference:
+        name = common.clean_filename(model.reference.name)
+        document.append(Command('$body', quote(name), quote(f'{name}.{model.mesh_type}')))
+
+    if not model.rename_material == '':
+        document.append(Command('$renamematerial', model.rename_material))
+
+    if model.collision:
+        name = common.clean_filename(model.collision.name)
+        document.append(Command(
+            '$collisionjoints' if model.joints else '$collisionmodel',
+            quote(f'{name}.{model.mesh_type}'),
+            block=[
+                Command('$concaveperjoint' if model.joints else '$concave'),
+                Command(f'$mass {model.mass}' if model.mass > 0 else '$automass'),
+                Command('$maxconvexpieces', 10000),
+            ],
+        ))
+
+    if model.bodygroups:
+        for bodygroup in model.bodygroups.children:
+            studios = [Command('studio', quote(f'{common.clean_filename(collection.name)}.{model.mesh_type}')) for collection in bodygroup.children]
+            document.append(Command('$bodygroup', quote(common.clean_filename(bodygroup.name)), block=studios))
+
+    if model.stacking:
+        for collection in model.stacking.children:
+            name = common.clean_filename(collection.name)
+            document.append(Command('$model', quote(name), quote(f'{name}.{model.mesh_type}')))
+
+    if not model.sequence_items:
+        document.append(Command('$sequence', quote('idle'), quote('anims/idle.SMD')))
+
+    for sequence in model.sequence_items:
+        block = [
+            Command(quote(f'anims/{common.clean_filename(sequence.name)}.SMD')),
+            Command('fps', sequence.framerate if sequence.use_framerate else fps),
+        ]
+
+        if sequence.use_range:
+            block.append(Command('frames', sequence.start, sequence.end))
+        if sequence.snap:
+            block.append(Command('snap'))
+        if sequence.loop:
+            block.append(Command('loop'))
+
+        block.append(Command('activity', quote(sequence.activity), sequence.weight))
+
+        for event in sequence.event_items:
+            block.append(Command('{', 'event', quote(event.event), event.frame, quote(event.value), '}'))
+
+        document.append(Command('$sequence', quote(sequence.name), block=block))
+
+    for attachment in model.attachment_items:
+        if model.armature and attachment.bone:
+            bone = f'{model.armature.name}.{attachment.bone}' if model.prepend_armature else attachment.bone
+            tokens = [quote(attachment.name), quote(bone), *attachment.offset[:3]]
+
+            if attachment.absolute:
+                tokens.append('absolute')
+            if attachment.rigid:
+                tokens.append('rigid')
+
+            document.append(Command('$attachment', *tokens, 'rotate', *attachment.rotation[:3]))
+
+    if model.skin_items:
+        skins = [Command('{', skin.name, '}') for skin in model.skin_items]
+        document.append(Command('$texturegroup', quote('skinfamilies'), block=skins, own_line=True))
+
+    if model.particle_items:
+        effects = []
+
+        for index, particle in enumerate(model.particle_items):
+            keys = [Command(quote('name'), quote(particle.name)), Command(quote('attachment_type'), quote(particle.attachment_type))]
+
+            if particle.attachment_point:
+                keys.append(Command(quote('attachment_point'), quote(particle.attachment_point)))
+
+            effects.append(Command(quote(f'effect{index}'), block=keys, own_line=True))
+
+        # Written like the QCs this addon always made, an empty line between effects and no line break at the end.
+        particles = Command('particles', block=effects, own_line=True, spaced=True)
+        document.append(Command('$keyvalues', block=[particles], own_line=True, end=''))
+
+    return document
@@ -0,0 +1,139 @@
+import os
+import time
+from itertools import count
+from queue import PriorityQueue
+from threading import Event, Lock, Thread
+from typing import Callable, List
+
+
+class Job:
+    '''One unit of work for the scheduler, a function that returns an error message or None.'''
+
+    def __init__(self, name: str, function: Callable, args: tuple, priority: int = 0, timeout: float = None, cancel: Callable = None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.timeout = timeout
+        self.on_cancel = cancel
+        self.cancel_requested = False
+        self.cancelled = False
+
+        self.status = 'QUEUED'
+        self.error = None
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None:
+            return 0.0
+
+        return (self.end or time.time()) - self.start
+
+    def run(self):
+        self.status = 'RUNNING'
+        self.start = time.time()
+
+        try:
+            if self.timeout:
+                self.error = self.function(*self.args, timeout=self.timeout)
+            else:
+                self.error = self.function(*self.args)
+        except Exception as exception:
+            self.error = f'{self.name}: {exception}'
+
+        self.end = time.time()
+
+        if self.cancelled:
+            self.status = 'CANCELLED'
+        else:
+            self.status = 'FAILED' if self.error else 'DONE'
+
+    def cancel(self) -> bool:
+        '''Ask a running job to stop, through the cancel function it was submitted with.
+        The job only counts as cancelled when that function confirms it stopped, otherwise it runs to the end.'''
+        self.cancel_requested = True
+
+        if self.on_cancel and self.on_cancel():
+            self.cancelled = True
+
+        return self.cancelled
+
+
+class Scheduler:
+    '''Run jobs on a bounded number of worker threads, lowest priority first and in order of submission otherwise.
+    Jobs with a timeout get it as a keyword argument, and are expected to give up once it expires.
+    Jobs with a cancel function have it called when the scheduler is cancelled while they run, it returns whether the job stopped.'''
+
+    def __init__(self, max_workers: int = 0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue = PriorityQueue()
+        self.order = count()
+        self.jobs = []
+        self.threads = []
+        self.lock = Lock()
+        self.cancelled = Event()
+
+    def submit(self, name: str, function: Callable, *args, priority: int = 0, timeout: float = None, cancel: Callable = None) -> Job:
+        job = Job(name, function, args, priority, timeout, cancel)
+
+        with self.lock:
+            self.jobs.append(job)
+
+        self.queue.put((priority, next(self.order), job))
+
+        # Start workers as jobs come in, never more than there are jobs.
+        if len(self.threads) < self.max_workers:
+            thread = Thread(target=self.work, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+        return job
+
+    def work(self):
+        while True:
+            priority, order, job = self.queue.get()
+
+            if job is None:
+                break
+
+            # Decide under the lock, so cancel sees every job that started.
+            with self.lock:
+                if self.cancelled.is_set():
+                    job.status = 'CANCELLED'
+                    continue
+
+                job.status = 'RUNNING'
+
+            job.run()
+
+    def done(self) -> bool:
+        return all(job.status not in {'QUEUED', 'RUNNING'} for job in self.jobs)
+
+    def cancel(self) -> int:
+        '''Skip every job that hasn't started yet, and cancel the running ones.
+        Returns how many running jobs couldn't be stopped and will still finish.'''
+        with self.lock:
+            self.cancelled.set()
+            running = [job for job in self.jobs if job.status == 'RUNNING']
+
+        return sum(not job.cancel() for job in running)
+
+    def wait(self) -> List[str]:
+        '''Wait for every job, stop the workers, and return the errors of failed jobs in submission order.'''
+        for _ in self.threads:
+            self.queue.put((float('inf'), next(self.order), None))
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+        return self.errors()
+
+    def errors(self) -> List[str]:
+        return [job.error for job in self.jobs if job.error]
+
+    def summary(self) -> str:
+        statuses = [job.status for job in self.jobs]
+        return ', '.join(f'{statuses.count(status)} {status.lower()}' for status in ('DONE', 'FAILED', 'CANCELLED') if status in statuses)
@@ -0,0 +1,387 @@
+'''Turn extracted SMD data into text, without touching Blender data.
+
+This module only depends on NumPy and the formatting module and must not import bpy,
+worker processes load it on its own without the rest of the addon.
+'''
+
+import os
+import sys
+import numpy
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from queue import Queue
+from threading import Thread
+from typing import BinaryIO, Iterator, List
+
+try:
+    from .. import formatting
+except ImportError:
+    import sourceops_formatting as formatting
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# Rough size of one formatted row, used to turn a buffer size in bytes into rows per chunk.
+ROW_SIZE = 128
+
+VERTEX = '0  ' + formatting.row_template([formatting.float_template(3), formatting.float_template(3), formatting.float_template(2)], separator='  ', end='')
+
+
+class Buffers:
+    '''Columnar storage for the contents of an SMD, written and read by Nodes, Skeleton and Triangles.'''
+
+    # Columns handed to worker processes through shared memory, the other fields are pickled.
+    ARRAYS = ('node_parents', 'frame_times', 'frame_bones', 'frame_transforms', 'material_ids', 'coords', 'normals', 'uvs', 'weight_offsets', 'weight_bones', 'weight_values')
+    FIELDS = ('node_names', 'node_text', 'frame_text', 'materials')
+
+    def __init__(self):
+        self.node_names = []
+        self.node_parents = numpy.empty(0, dtype=numpy.int32)
+        self.node_text = None
+
+        self.frame_times = numpy.empty(0, dtype=numpy.int32)
+        self.frame_bones = numpy.empty(0, dtype=numpy.int32)
+        self.frame_transforms = numpy.empty((0, 0, 6), dtype=numpy.float32)
+        self.frame_text = None
+
+        self.materials = []
+        self.material_ids = numpy.empty(0, dtype=numpy.int32)
+        self.coords = numpy.empty((0, 3), dtype=numpy.float32)
+        self.normals = numpy.empty((0, 3), dtype=numpy.float32)
+        self.uvs = numpy.empty((0, 2), dtype=numpy.float32)
+        self.weight_offsets = numpy.zeros(1, dtype=numpy.int32)
+        self.weight_bones = numpy.empty(0, dtype=numpy.int32)
+        self.weight_values = numpy.empty(0, dtype=numpy.float32)
+
+        self.material_table = {}
+        self.triangle_chunks = []
+
+    def add_materials(self, names: List[str]) -> numpy.ndarray:
+        '''Add names to the material table, return the material id of each name.'''
+        ids = []
+
+        for name in names:
+            if name not in self.material_table:
+                self.material_table[name] = len(self.materials)
+                self.materials.append(name)
+
+            ids.append(self.material_table[name])
+
+        return numpy.array(ids, dtype=numpy.int32)
+
+    def add_triangles(self, material_ids, coords, normals, uvs, weight_counts, weight_bones, weight_values):
+        '''Queue the triangles of one mesh, they are joined into the columns by pack.'''
+        self.triangle_chunks.append((material_ids, coords, normals, uvs, weight_counts, weight_bones, weight_values))
+
+    def pack(self):
+        '''Join queued triangles into contiguous columns.'''
+        if not self.triangle_chunks:
+            return
+
+        columns = list(zip(*self.triangle_chunks))
+        self.triangle_chunks = []
+
+        material_ids, coords, normals, uvs, weight_counts, weight_bones, weight_values = columns
+        self.material_ids = numpy.concatenate((self.material_ids,) + material_ids)
+        self.coords = numpy.concatenate((self.coords,) + coords)
+        self.normals = numpy.concatenate((self.normals,) + normals)
+        self.uvs = numpy.concatenate((self.uvs,) + uvs)
+
+        counts = numpy.concatenate(weight_counts)
+        offsets = numpy.cumsum(counts, dtype=numpy.int32) + self.weight_offsets[-1]
+        self.weight_offsets = numpy.concatenate((self.weight_offsets, offsets))
+        self.weight_bones = numpy.concatenate((self.weight_bones,) + weight_bones)
+        self.weight_values = numpy.concatenate((self.weight_values,) + weight_values)
+
+    def rows(self) -> int:
+        '''Get the number of rows this SMD formats, a measure of how long serialization takes.'''
+        return len(self.node_names) + self.frame_transforms.shape[0] * self.frame_transforms.shape[1] + len(self.coords)
+
+    def share(self) -> tuple:
+        '''Copy the columns into one shared memory block, return the block and a picklable layout.'''
+        arrays = [numpy.ascontiguousarray(getattr(self, name)) for name in self.ARRAYS]
+        block = shared_memory.SharedMemory(create=True, size=max(1, sum(array.nbytes for array in arrays)))
+        layout = {'block': block.name, 'arrays': [], 'fields': {name: getattr(self, name) for name in self.FIELDS}}
+        offset = 0
+
+        for name, array in zip(self.ARRAYS, arrays):
+            numpy.ndarray(array.shape, array.dtype, block.buf, offset)[...] = array
+            layout['arrays'].append((name, array.dtype.str, array.shape, offset))
+            offset += array.nbytes
+
+        return block, layout
+
+    @classmethod
+    def attach(cls, layout: dict) -> 'Buffers':
+        '''Read columns from a shared memory block made by share, the block is left for its owner to unlink.'''
+        buffers = cls()
+        block = shared_memory.SharedMemory(name=layout['block'])
+
+        try:
+            for name, dtype, shape, offset in layout['arrays']:
+                setattr(buffers, name, numpy.ndarray(shape, dtype, block.buf, offset).copy())
+        finally:
+            block.close()
+
+        for name, value in layout['fields'].items():
+            setattr(buffers, name, value)
+
+        return buffers
+
+
+def nodes(buffers: Buffers, size: int) -> Iterator[str]:
+    if buffers.node_text is not None:
+        yield buffers.node_text
+        return
+
+    yield f'nodes\n'
+
+    names = buffers.node_names
+    parents = buffers.node_parents
+    template = '%d "%s" %d\n'
+
+    for start in range(0, len(names), size):
+        end = min(start + size, len(names))
+        rows = formatting.columns(numpy.arange(start, end), names[start:end], parents[start:end])
+        yield formatting.format_rows(template, rows)
+
+    yield f'end\n'
+
+
+def skeleton(buffers: Buffers, size: int) -> Iterator[str]:
+    if buffers.frame_text is not None:
+        yield buffers.frame_text
+        return
+
+    yield f'skeleton\n'
+
+    bones = buffers.frame_bones
+    times = buffers.frame_times
+    transforms = buffers.frame_transforms
+
+    bone = formatting.row_template([formatting.INT, formatting.float_template(3), formatting.float_template(3)], separator='  ')
+    template = 'time %d\n' + bone * len(bones)
+    step = max(1, size // max(1, len(bones)))
+
+    for start in range(0, len(times), step):
+        end = min(start + step, len(times))
+
+        # One row per frame, the time followed by the index and transforms of every bone.
+        frames = numpy.empty((end - start, len(bones), 7), dtype=object)
+        frames[:, :, 0] = bones.astype(object)
+        frames[:, :, 1:] = transforms[start:end].astype(object)
+
+        rows = formatting.columns(times[start:end], frames.reshape(end - start, -1))
+        yield formatting.format_rows(template, rows)
+
+    yield f'end\n'
+
+
+def triangles(buffers: Buffers, size: int) -> Iterator[str]:
+    yield f'triangles\n'
+
+    count = len(buffers.material_ids)
+    step = max(1, size // 3)
+
+    for start in range(0, count, step):
+        yield format_triangles(buffers, start, min(start + step, count))
+
+    yield f'end\n'
+
+
+def format_triangles(buffers: Buffers, first: int, last: int) -> str:
+    '''Format the triangles from first up to but not including last.'''
+    loops = slice(first * 3, last * 3)
+
+    materials = numpy.array(buffers.materials + [''], dtype=object)[buffers.material_ids[first:last]]
+    rows = numpy.hstack((buffers.coords[loops], buffers.normals[loops], buffers.uvs[loops]))
+    offsets = buffers.weight_offsets[first * 3:last * 3 + 1]
+    counts = offsets[1:] - offsets[:-1]
+
+    if not counts.any():
+        template = '%s\n' + f'{VERTEX}\n' * 3
+        return formatting.format_rows(template, formatting.columns(materials, rows.reshape(-1, 24)))
+
+    # Vertices with the same number of weights share a template, format each group at once.
+    vertices = numpy.empty(len(rows), dtype=object)
+
+    for count in numpy.unique(counts).tolist():
+        indices = numpy.flatnonzero(counts == count)
+        template = VERTEX
+
+        if count:
+            template += '  %d  ' + ' '.join(['%d %.6f'] * count)
+            gather = offsets[indices][:, numpy.newaxis] + numpy.arange(count)
+            weights = numpy.empty((len(indices), count, 2), dtype=object)
+            weights[:, :, 0] = buffers.weight_bones[gather].astype(object)
+            weights[:, :, 1] = buffers.weight_values[gather].astype(object)
+            group = formatting.columns(rows[indices], numpy.full(len(indices), count), weights.reshape(len(indices), -1))
+        else:
+            group = rows[indices]
+
+        vertices[indices] = formatting.format_rows(template + '\n', group).splitlines(keepends=True)
+
+    return formatting.format_rows('%s\n%s%s%s', formatting.columns(materials, vertices.reshape(-1, 3)))
+
+
+def chunks(buffers: Buffers, size: int) -> Iterator[str]:
+    yield f'version 1\n'
+    yield from nodes(buffers, size)
+    yield from skeleton(buffers, size)
+    yield from triangles(buffers, size)
+
+
+def write(file: BinaryIO, buffers: Buffers, buffer_size: int = 1 << 20):
+    '''Stream an SMD to a binary file, formatting the next chunk while the previous one is written.'''
+    size = max(1, buffer_size // ROW_SIZE)
+    queue = Queue(maxsize=2)
+    errors = []
+
+    thread = Thread(target=write_chunks, args=(file, queue, errors), daemon=True)
+    thread.start()
+
+    try:
+        for chunk in chunks(buffers, size):
+            if errors:
+                break
+
+            # Match the line endings text mode would have written.
+            if os.linesep != '\n':
+                chunk = chunk.replace('\n', os.linesep)
+
+            queue.put(chunk.encode('utf-8'))
+
+    finally:
+        queue.put(None)
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def write_chunks(file: BinaryIO, queue: Queue, errors: list):
+    while True:
+        chunk = queue.get()
+
+        if chunk is None:
+            break
+
+        # Keep draining the queue after a failure so the formatting side never blocks.
+        if not errors:
+            try:
+                file.write(chunk)
+            except Exception as exception:
+                errors.append(exception)
+
+
+def write_path(buffers: Buffers, path: str, buffer_size: int = 1 << 20):
+    with open(path, 'wb', buffering=buffer_size) as file:
+        write(file, buffers, buffer_size)
+
+
+def write_shared(layout: dict, path: str, buffer_size: int):
+    '''Worker entry point, write an SMD from columns in shared memory.'''
+    write_path(Buffers.attach(layout), path, buffer_size)
+
+
+# Load the modules a worker needs by path under top level names, the addon package can't be imported without Blender.
+BOOTSTRAP = '''
+import importlib.util
+import sys
+
+for name, path in %r:
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+'''
+
+
+class Pool:
+    '''Write SMDs from worker processes, small SMDs and SMDs that can't be handed over are written in this process.'''
+
+    # SMDs with fewer rows than this aren't worth the round trip to a worker.
+    MIN_ROWS = 4096
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.broken = not shared_memory or self.workers < 2
+        self.jobs = []
+
+    def start(self):
+        modules = (('sourceops_formatting', formatting.__file__), ('sourceops_serialize', __file__))
+        bootstrap = BOOTSTRAP % (modules,)
+        exec(bootstrap, {})
+
+        self.worker = sys.modules['sourceops_serialize'].write_shared
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'), initializer=exec, initargs=(bootstrap, {}))
+
+    def submit(self, buffers: Buffers, path: str, buffer_size: int = 1 << 20) -> Future:
+        '''Write buffers to path, return a future that is done when the file is written.'''
+        result = Future()
+
+        if self.broken or buffers.rows() < self.MIN_ROWS:
+            self.run(result, buffers, path, buffer_size)
+            return result
+
+        try:
+            if not self.executor:
+                self.start()
+
+            block, layout = buffers.share()
+            future = self.executor.submit(self.worker, layout, str(path), buffer_size)
+        except Exception:
+            self.broken = True
+            self.run(result, buffers, path, buffer_size)
+            return result
+
+        self.jobs.append((future, block, buffers, path, buffer_size, result))
+
+        # Keep a bounded number of SMDs in flight, each holds its columns twice.
+        while len(self.jobs) > self.workers * 2:
+            self.finish(self.jobs.pop(0))
+
+        return result
+
+    def run(self, result: Future, buffers: Buffers, path: str, buffer_size: int):
+        try:
+            write_path(buffers, path, buffer_size)
+        except Exception as exception:
+            result.set_exception(exception)
+        else:
+            result.set_result(None)
+
+    def finish(self, job: tuple):
+        future, block, buffers, path, buffer_size, result = job
+
+        try:
+            future.result()
+        except BrokenProcessPool:
+            # Worker processes couldn't start or died, write this and every following SMD here.
+            self.broken = True
+            self.run(result, buffers, path, buffer_size)
+        except Exception as exception:
+            result.set_exception(exception)
+        else:
+            result.set_result(None)
+        finally:
+            block.close()
+            block.unlink()
+
+    def drain(self):
+        '''Wait for every SMD to be written, the worker processes keep running for the next ones.'''
+        while self.jobs:
+            self.finish(self.jobs.pop(0))
+
+    def shutdown(self):
+        '''Wait for every SMD to be written and stop the worker processes.'''
+        self.drain()
+
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
@@ -1,11 +1,22 @@
 import bpy
-from typing import List
+import re
+import numpy
+from contextlib import contextmanager
+from mathutils import Euler, Matrix, Quaternion, Vector
+from typing import BinaryIO, Iterator, List
+from ... utils.scene_state import SceneState, scene_state
+from . import serialize
+from . serialize import Buffers
 
 
 class Settings:
-    def __init__(self, prepend_armature: bool, ignore_transforms: bool):
+    def __init__(self, prepend_armature: bool, ignore_transforms: bool, limit_weights: bool = False, sampling: str = 'SCENE', triangulation: str = 'MODIFIER', bulk: bool = True):
         self.prepend_armature = prepend_armature
         self.ignore_transforms = ignore_transforms
+        self.limit_weights = limit_weights
+        self.sampling = sampling
+        self.triangulation = triangulation
+        self.bulk = bulk
 
 
 class Lookup:
@@ -18,339 +29,543 @@ class Lookup:
             name = 'Implicit'
 
         self.bones = [name]
+        self.indices = {name: 0}
 
     def __getitem__(self, key: str) -> int:
-        if key in self.bones:
-            return self.bones.index(key)
+        return self.indices.get(key, -1)
+
+    def name(self, armature: bpy.types.Object, name: str) -> str:
+        if self.settings.prepend_armature:
+            return f'{armature.name}.{name}'
         else:
-            return -1
+            return name
 
     def from_blender(self, armature: bpy.types.Object):
         if armature:
             for bone in armature.data.bones:
                 bone: bpy.types.Bone
+                name = self.name(armature, bone.name)
 
-                if self.settings.prepend_armature:
-                    name = f'{armature.name}.{bone.name}'
-                else:
-                    name = bone.name
-
+                # The first bone with a given name wins, same as searching the list would.
+                self.indices.setdefault(name, len(self.bones))
                 self.bones.append(name)
 
+    def remap(self, armature: bpy.types.Object, object: bpy.types.Object) -> numpy.ndarray:
+        '''Get the SMD bone index for each vertex group of an object, or -1 for groups without a bone.'''
+        indices = [self[self.name(armature, group.name)] for group in object.vertex_groups]
+        return numpy.array(indices, dtype=numpy.int32)
 
-class Node:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.index = 0
 
-        if self.settings.prepend_armature:
-            name = 'Source.Implicit'
-        else:
-            name = 'Implicit'
+class ActionSampler:
+    '''Evaluate the F-curves of an action straight into pose matrices, without evaluating the scene.'''
 
-        self.name = name
-        self.parent = -1
+    PATH = re.compile(r'^pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(\w+)$')
+    CHANNELS = {'location', 'rotation_quaternion', 'rotation_euler', 'rotation_axis_angle', 'scale'}
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, bone: bpy.types.Bone):
-        if self.settings.prepend_armature:
-            name = f'{armature.name}.{bone.name}'
-        else:
-            name = bone.name
+    def __init__(self, armature: bpy.types.Object, action: bpy.types.Action):
+        self.armature = armature
+        self.curves = {}
+        self.supported = self.parse(action)
+
+    def parse(self, action: bpy.types.Action) -> bool:
+        '''Collect the F-curves per bone and channel, return whether the action can be sampled without the scene.'''
+        fcurves = getattr(action, 'fcurves', None)
+
+        # Layered actions keep their F-curves elsewhere.
+        if fcurves is None:
+            return False
+
+        # Anything beyond plain bone channels needs the depsgraph to match scene evaluation.
+        # That includes NLA tracks and an action that doesn't simply replace the pose, F-curves alone ignore blending.
+        animation_data = self.armature.animation_data
+        if animation_data:
+            if animation_data.drivers or animation_data.nla_tracks or animation_data.use_tweak_mode:
+                return False
+
+            if getattr(animation_data, 'action_blend_type', 'REPLACE') != 'REPLACE' or getattr(animation_data, 'action_influence', 1.0) != 1.0:
+                return False
+
+            if getattr(animation_data, 'action_extrapolation', 'HOLD') != 'HOLD':
+                return False
+
+        if self.armature.parent or self.armature.constraints:
+            return False
+
+        if any(pose_bone.constraints for pose_bone in self.armature.pose.bones):
+            return False
+
+        for fcurve in fcurves:
+            # Object level F-curves move the armature itself, which only the scene can evaluate.
+            if not fcurve.data_path.startswith('pose.bones['):
+                return False
+
+            match = self.PATH.match(fcurve.data_path)
+
+            # Custom properties and other bone settings don't change the pose matrices.
+            if fcurve.mute or not match or match.group(2) not in self.CHANNELS:
+                continue
 
-        if bone.parent:
-            if self.settings.prepend_armature:
-                parent = lookup[f'{armature.name}.{bone.parent.name}']
+            name = match.group(1).replace('\\"', '"').replace('\\\\', '\\')
+            channels = self.curves.setdefault(name, {})
+            channels.setdefault(match.group(2), {})[fcurve.array_index] = fcurve
+
+        return True
+
+    def evaluate(self, channels: dict, channel: str, values, time: int) -> list:
+        '''Get the animated values of a channel, channels without F-curves keep their current values.'''
+        values = list(values)
+
+        for index, fcurve in channels.get(channel, {}).items():
+            if index < len(values):
+                values[index] = fcurve.evaluate(time)
+
+        return values
+
+    def basis(self, pose_bone: bpy.types.PoseBone, time: int) -> Matrix:
+        '''Build the local transform of a pose bone the same way Blender does.'''
+        channels = self.curves.get(pose_bone.name, {})
+        location = self.evaluate(channels, 'location', pose_bone.location, time)
+        scale = self.evaluate(channels, 'scale', pose_bone.scale, time)
+        mode = pose_bone.rotation_mode
+
+        if mode == 'QUATERNION':
+            quaternion = Quaternion(self.evaluate(channels, 'rotation_quaternion', pose_bone.rotation_quaternion, time))
+            rotation = quaternion.normalized().to_matrix()
+
+        elif mode == 'AXIS_ANGLE':
+            angle, *axis = self.evaluate(channels, 'rotation_axis_angle', pose_bone.rotation_axis_angle, time)
+            axis = Vector(axis)
+
+            if axis.length > 0:
+                rotation = Matrix.Rotation(angle, 3, axis)
             else:
-                parent = lookup[bone.parent.name]
+                rotation = Matrix.Identity(3)
+
         else:
-            parent = -1
+            rotation = Euler(self.evaluate(channels, 'rotation_euler', pose_bone.rotation_euler, time), mode).to_matrix()
+
+        matrix = (rotation @ Matrix.Diagonal(scale)).to_4x4()
+        matrix.translation = location
+        return matrix
+
+    def matrices(self, time: int) -> List[Matrix]:
+        '''Get the pose space matrix of every pose bone at a frame.'''
+        matrices = {}
+
+        def matrix(pose_bone: bpy.types.PoseBone) -> Matrix:
+            if pose_bone.name not in matrices:
+                bone = pose_bone.bone
+                basis = self.basis(pose_bone, time)
+
+                if pose_bone.parent:
+                    parent = pose_bone.parent
+                    matrices[pose_bone.name] = bone.convert_local_to_pose(
+                        basis,
+                        bone.matrix_local,
+                        parent_matrix=matrix(parent),
+                        parent_matrix_local=parent.bone.matrix_local,
+                    )
 
-        self.index = lookup[name]
-        self.name = name
-        self.parent = parent
+                else:
+                    matrices[pose_bone.name] = bone.convert_local_to_pose(basis, bone.matrix_local)
 
-    def to_string(self) -> str:
-        return f'{self.index} "{self.name}" {self.parent}\n'
+            return matrices[pose_bone.name]
+
+        return [matrix(pose_bone) for pose_bone in self.armature.pose.bones]
 
 
 class Nodes:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, buffers: Buffers):
         self.settings = settings
-        self.nodes = [Node(self.settings)]
+        self.buffers = buffers
 
     def from_blender(self, lookup: Lookup, armature: bpy.types.Object):
+        names = [lookup.bones[0]]
+        parents = [-1]
+
         if armature:
             for bone in armature.data.bones:
                 bone: bpy.types.Bone
+                names.append(lookup.name(armature, bone.name))
+
+                if bone.parent:
+                    parents.append(lookup[lookup.name(armature, bone.parent.name)])
+                else:
+                    parents.append(-1)
+
+        self.buffers.node_names = names
+        self.buffers.node_parents = numpy.array(parents, dtype=numpy.int32)
 
-                node = Node(self.settings)
-                node.from_blender(lookup, armature, bone)
-                self.nodes.append(node)
+    def chunks(self, size: int) -> Iterator[str]:
+        return serialize.nodes(self.buffers, size)
 
     def to_string(self) -> str:
-        header = f'nodes\n'
-        nodes = ''.join(bone.to_string() for bone in self.nodes)
-        footer = f'end\n'
-        return f'{header}{nodes}{footer}'
+        return ''.join(self.chunks(len(self.buffers.node_names) or 1))
 
 
-class RestBone:
-    def __init__(self, settings: Settings):
+class Skeleton:
+    def __init__(self, settings: Settings, buffers: Buffers):
         self.settings = settings
-        self.index = 0
-        self.translation = [0, 0, 0]
-        self.rotation = [0, 0, 0]
+        self.buffers = buffers
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, bone: bpy.types.Bone):
-        if self.settings.prepend_armature:
-            name = f'{armature.name}.{bone.name}'
-        else:
-            name = bone.name
+    def rest_from_blender(self, armature: bpy.types.Object) -> numpy.ndarray:
+        '''Get translation and rotation rows for the rest pose, the first row is the implicit bone.'''
+        rows = numpy.zeros((len(armature.data.bones) + 1, 6), dtype=numpy.float32)
+
+        for row, bone in enumerate(armature.data.bones, start=1):
+            bone: bpy.types.Bone
 
-        if bone.parent:
-            parent = bone.parent.matrix_local.inverted_safe()
-            matrix = parent @ bone.matrix_local
+            if bone.parent:
+                parent = bone.parent.matrix_local.inverted_safe()
+                matrix = parent @ bone.matrix_local
 
-        elif not self.settings.ignore_transforms:
-            transforms = armature.matrix_world
-            matrix = transforms @ bone.matrix_local
+            elif not self.settings.ignore_transforms:
+                transforms = armature.matrix_world
+                matrix = transforms @ bone.matrix_local
 
-        else:
-            matrix = bone.matrix_local
+            else:
+                matrix = bone.matrix_local
 
-        self.index = lookup[name]
-        self.translation = matrix.to_translation()[0:3]
-        self.rotation = matrix.to_euler()[0:3]
+            rows[row, 0:3] = matrix.to_translation()
+            rows[row, 3:6] = matrix.to_euler()
 
-    def to_string(self) -> str:
-        index = f'{self.index}'
-        translation = ' '.join(f'{n:.6f}' for n in self.translation)
-        rotation = ' '.join(f'{n:.6f}' for n in self.rotation)
-        return f'{index}  {translation}  {rotation}\n'
+        return rows
 
+    def pose_from_blender(self, armature: bpy.types.Object, matrices: List[Matrix] = None) -> numpy.ndarray:
+        '''Get translation and rotation rows for the current pose, or for the given pose bone matrices.
+        The first row is the implicit bone.'''
+        rows = numpy.zeros((len(armature.pose.bones) + 1, 6), dtype=numpy.float32)
 
-class RestFrame:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.bones = [RestBone(self.settings)]
+        if matrices is None:
+            matrices = [bone.matrix for bone in armature.pose.bones]
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object):
-        for bone in armature.data.bones:
-            bone: bpy.types.Bone
+        indices = {bone.name: index for index, bone in enumerate(armature.pose.bones)}
 
-            rest_bone = RestBone(self.settings)
-            rest_bone.from_blender(lookup, armature, bone)
-            self.bones.append(rest_bone)
+        for row, bone in enumerate(armature.pose.bones, start=1):
+            bone: bpy.types.PoseBone
 
-    def to_string(self) -> str:
-        time = f'time 0\n'
-        bones = ''.join(bone.to_string() for bone in self.bones)
-        return f'{time}{bones}'
+            if bone.parent:
+                parent = matrices[indices[bone.parent.name]].inverted_safe()
+                matrix = parent @ matrices[row - 1]
 
+            elif not self.settings.ignore_transforms:
+                transforms = armature.matrix_world
+                matrix = transforms @ matrices[row - 1]
 
-class PoseBone:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.index = 0
-        self.translation = [0, 0, 0]
-        self.rotation = [0, 0, 0]
+            else:
+                matrix = matrices[row - 1]
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, bone: bpy.types.PoseBone):
-        if self.settings.prepend_armature:
-            name = f'{armature.name}.{bone.name}'
-        else:
-            name = bone.name
+            rows[row, 0:3] = matrix.to_translation()
+            rows[row, 3:6] = matrix.to_euler()
 
-        if bone.parent:
-            parent = bone.parent.matrix.inverted_safe()
-            matrix = parent @ bone.matrix
+        return rows
 
-        elif not self.settings.ignore_transforms:
-            transforms = armature.matrix_world
-            matrix = transforms @ bone.matrix
+    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, action: bpy.types.Action):
+        if not armature:
+            bones = [0]
+            times = [0]
+            frames = [numpy.zeros((1, 6), dtype=numpy.float32)]
+
+        elif not action:
+            bones = [0] + [lookup[lookup.name(armature, bone.name)] for bone in armature.data.bones]
+            times = [0]
+            frames = [self.rest_from_blender(armature)]
 
         else:
-            matrix = bone.matrix
+            self.from_samples(lookup, armature, *self.sample(armature, [action])[action])
+            return
+
+        self.buffers.frame_bones = numpy.array(bones, dtype=numpy.int32)
+        self.buffers.frame_times = numpy.array(times, dtype=numpy.int32)
+        self.buffers.frame_transforms = numpy.stack(frames)
+
+    def from_samples(self, lookup: Lookup, armature: bpy.types.Object, times: list, frames: list):
+        '''Fill the skeleton with frames sampled from an action.'''
+        bones = [0] + [lookup[lookup.name(armature, bone.name)] for bone in armature.pose.bones]
+        self.buffers.frame_bones = numpy.array(bones, dtype=numpy.int32)
+        self.buffers.frame_times = numpy.array(times, dtype=numpy.int32)
+        self.buffers.frame_transforms = numpy.stack(frames)
+
+    def sample(self, armature: bpy.types.Object, actions: List[bpy.types.Action]) -> dict:
+        '''Sample every action once, return a dict of action to times and frames.'''
+        samples = {}
+        scene_actions = []
+
+        for action in dict.fromkeys(actions):
+            if self.settings.sampling == 'ACTION':
+                sampler = ActionSampler(armature, action)
+            else:
+                sampler = None
 
-        self.index = lookup[name]
-        self.translation = matrix.to_translation()[0:3]
-        self.rotation = matrix.to_euler()[0:3]
+            if sampler and sampler.supported:
+                samples[action] = self.sample_action(armature, action, sampler)
+            else:
+                scene_actions.append(action)
+
+        # The action and frame only change while sampling, so they get a state of their own that is restored right after.
+        # A state shared with the rest of the export would leave them changed for the bodies exported later.
+        if scene_actions:
+            with SceneState() as state:
+                samples.update(self.sample_scene(armature, scene_actions, state))
+
+        return samples
+
+    def frame_range(self, action: bpy.types.Action) -> range:
+        start = max(0, int(action.frame_range[0]))
+        end = max(0, int(action.frame_range[1]))
+        return range(start, end + 1)
+
+    def sample_action(self, armature: bpy.types.Object, action: bpy.types.Action, sampler: ActionSampler) -> tuple:
+        '''Sample an action by evaluating its F-curves, the scene is not touched.'''
+        times = list(self.frame_range(action))
+        frames = [self.pose_from_blender(armature, sampler.matrices(time)) for time in times]
+        return times, frames
+
+    def sample_scene(self, armature: bpy.types.Object, actions: List[bpy.types.Action], state: SceneState) -> dict:
+        '''Sample actions by assigning them to the armature, in one pass over the frames all of them need.
+        Every change goes through the scene state, so the action, frame and pose are put back when it's restored, also after an error.'''
+        samples = {}
+        scene = bpy.context.scene
+        view_layer = bpy.context.view_layer
+
+        if not armature.animation_data:
+            armature.animation_data_create()
+            state.defer(armature.animation_data_clear)
+
+        # Without an action the pose is what the user left it at, local matrices can be put back in any order.
+        if not armature.animation_data.action:
+            for pose_bone in armature.pose.bones:
+                pose_bone: bpy.types.PoseBone
+                state.set(pose_bone, 'matrix_basis', pose_bone.matrix_basis.copy())
+
+        # Registered before the action changes, so the original frame is evaluated with the original action.
+        frame = scene.frame_current
+        state.defer(lambda: scene.frame_set(frame))
+
+        if armature.data.pose_position != 'POSE':
+            state.set(armature.data, 'pose_position', 'POSE')
+
+        # Every frame any of the actions needs, with the actions that need it.
+        schedule = {}
+
+        for action in actions:
+            samples[action] = [], []
+
+            for time in self.frame_range(action):
+                schedule.setdefault(time, []).append(action)
+
+        # Walk the timeline once. Changing the frame evaluates the whole scene, which happens once per frame for all actions.
+        # The other actions at that frame only need the armature evaluated again, which a view layer update does.
+        for time in sorted(schedule):
+            for index, action in enumerate(schedule[time]):
+                state.set(armature.animation_data, 'action', action)
+
+                if index == 0:
+                    scene.frame_set(time)
+                else:
+                    view_layer.update()
+
+                times, frames = samples[action]
+                times.append(time)
+                frames.append(self.pose_from_blender(armature))
+
+        return samples
+
+    def chunks(self, size: int) -> Iterator[str]:
+        return serialize.skeleton(self.buffers, size)
 
     def to_string(self) -> str:
-        index = f'{self.index}'
-        translation = ' '.join(f'{n:.6f}' for n in self.translation)
-        rotation = ' '.join(f'{n:.6f}' for n in self.rotation)
-        return f'{index}  {translation}  {rotation}\n'
+        return ''.join(self.chunks(self.buffers.frame_transforms.size or 1))
 
 
-class PoseFrame:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.time = 0
-        self.bones = [PoseBone(self.settings)]
+class MeshData:
+    '''The arrays of one triangulated mesh, read in bulk with foreach_get.
+    Everything that depends on the armature is left out, so one evaluation serves every SMD the object is in.
+    Vertex group weights are only read when asked for, they are empty otherwise.'''
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, time: int):
-        self.time = time
+    def __init__(self, mesh: bpy.types.Mesh, loop_triangles: bool = False, matrix: Matrix = None, groups: bool = False):
+        vertex_count = len(mesh.vertices)
+        loop_count = len(mesh.loops)
 
-        for bone in armature.pose.bones:
-            bone: bpy.types.PoseBone
+        positions = numpy.empty(vertex_count * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get('co', positions)
+        positions.shape = (vertex_count, 3)
 
-            pose_bone = PoseBone(self.settings)
-            pose_bone.from_blender(lookup, armature, bone)
-            self.bones.append(pose_bone)
+        vertex_indices = numpy.empty(loop_count, dtype=numpy.int32)
+        mesh.loops.foreach_get('vertex_index', vertex_indices)
 
-    def to_string(self) -> str:
-        time = f'time {self.time}\n'
-        bones = ''.join(bone.to_string() for bone in self.bones)
-        return f'{time}{bones}'
+        normals = numpy.empty(loop_count * 3, dtype=numpy.float32)
+        if hasattr(mesh, 'corner_normals'):
+            mesh.corner_normals.foreach_get('vector', normals)
+        else:
+            mesh.loops.foreach_get('normal', normals)
+        normals.shape = (loop_count, 3)
+
+        uvs = numpy.zeros(loop_count * 2, dtype=numpy.float32)
+        if mesh.uv_layers:
+            mesh.uv_layers.active.data.foreach_get('uv', uvs)
+        uvs.shape = (loop_count, 2)
 
+        if loop_triangles:
+            loops, material_indices = self.triangles_from_loop_triangles(mesh)
+        else:
+            loops, material_indices = self.triangles_from_polygons(mesh)
 
-class Skeleton:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.frames = []
+        if matrix is not None:
+            positions, normals = self.transform(matrix, positions, normals)
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, action: bpy.types.Action):
-        if not armature:
-            frame = RestFrame(self.settings)
-            self.frames.append(frame)
+        self.positions = positions
+        self.vertex_indices = vertex_indices[loops]
+        self.coords = positions[self.vertex_indices]
+        self.normals = normals[loops]
+        self.uvs = uvs[loops]
 
-        elif not action:
-            frame = RestFrame(self.settings)
-            frame.from_blender(lookup, armature)
-            self.frames.append(frame)
+        # Material indices past the end of the material list fall back to no_material.
+        self.materials = [getattr(material, 'name', 'no_material') for material in mesh.materials] + ['no_material']
+        material_indices[material_indices >= len(mesh.materials)] = len(mesh.materials)
+        self.material_indices = material_indices
 
+        if groups:
+            self.group_counts, self.groups, self.weights = self.groups_from_mesh(mesh)
         else:
-            if not armature.animation_data:
-                new_animation_data = armature.animation_data_create()
-            else:
-                new_animation_data = None
+            self.group_counts = numpy.zeros(vertex_count, dtype=numpy.int32)
+            self.groups = numpy.empty(0, dtype=numpy.int32)
+            self.weights = numpy.empty(0, dtype=numpy.float32)
 
-            original_action = armature.animation_data.action
-            armature.animation_data.action = action
+    def triangles_from_polygons(self, mesh: bpy.types.Mesh) -> tuple:
+        '''Get the loops and material index of every triangle, for a mesh that was triangulated by a modifier.'''
+        poly_count = len(mesh.polygons)
 
-            if not original_action:
-                pose_backup = {}
+        loop_starts = numpy.empty(poly_count, dtype=numpy.int32)
+        mesh.polygons.foreach_get('loop_start', loop_starts)
 
-                for pose_bone in armature.pose.bones:
-                    pose_bone: bpy.types.PoseBone
-                    pose_backup[pose_bone] = pose_bone.matrix.copy()
+        material_indices = numpy.empty(poly_count, dtype=numpy.int32)
+        mesh.polygons.foreach_get('material_index', material_indices)
 
-            original_frame = bpy.context.scene.frame_current
+        # Polygons are triangles at this point, so every polygon owns three consecutive loops.
+        loops = (loop_starts[:, numpy.newaxis] + numpy.arange(3, dtype=numpy.int32)).ravel()
+        return loops, material_indices
 
-            start = max(0, int(action.frame_range[0]))
-            end = max(0, int(action.frame_range[1]))
+    def triangles_from_loop_triangles(self, mesh: bpy.types.Mesh) -> tuple:
+        '''Get the loops and material index of every triangle from the triangulation Blender keeps for drawing.'''
+        mesh.calc_loop_triangles()
+        triangle_count = len(mesh.loop_triangles)
 
-            for time in range(start, end + 1):
-                bpy.context.scene.frame_set(time)
+        loops = numpy.empty(triangle_count * 3, dtype=numpy.int32)
+        mesh.loop_triangles.foreach_get('loops', loops)
 
-                frame = PoseFrame(self.settings)
-                frame.from_blender(lookup, armature, time)
-                self.frames.append(frame)
+        material_indices = numpy.empty(triangle_count, dtype=numpy.int32)
+        mesh.loop_triangles.foreach_get('material_index', material_indices)
 
-            bpy.context.scene.frame_set(original_frame)
+        return loops, material_indices
 
-            if not original_action:
-                for pose_bone, matrix in pose_backup.items():
-                    pose_bone.matrix = matrix
+    def transform(self, matrix: Matrix, positions: numpy.ndarray, normals: numpy.ndarray) -> tuple:
+        '''Move positions and normals into world space, normals use the inverse transpose so they stay perpendicular.
+        Like Mesh.transform, a matrix that can't be inverted, for example scaled to zero on one axis, doesn't raise.'''
+        rotation = numpy.array(matrix.to_3x3(), dtype=numpy.float64)
+        positions = positions @ rotation.T + numpy.array(matrix.translation, dtype=numpy.float64)
 
-            if new_animation_data:
-                armature.animation_data_clear()
-            else:
-                armature.animation_data.action = original_action
+        normals = normals @ numpy.array(matrix.to_3x3().inverted_safe(), dtype=numpy.float64)
+        lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+        normals = numpy.divide(normals, lengths, out=normals, where=lengths > 0)
 
-    def to_string(self) -> str:
-        header = f'skeleton\n'
-        frames = ''.join(frame.to_string() for frame in self.frames)
-        footer = f'end\n'
-        return f'{header}{frames}{footer}'
+        return positions.astype(numpy.float32), normals.astype(numpy.float32)
 
+    def groups_from_mesh(self, mesh: bpy.types.Mesh) -> tuple:
+        '''Get vertex group weights per vertex as CSR arrays of counts, group indices and weights.'''
+        # Weights have no bulk access on the mesh, but the groups of each vertex can be read in bulk into their slice.
+        elements = [vertex.groups for vertex in mesh.vertices]
+        counts = numpy.fromiter(map(len, elements), dtype=numpy.int32, count=len(elements))
 
-class Vertex:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.coords = [0, 0, 0]
-        self.normal = [0, 0, 0]
-        self.uvs = [0, 0]
-        self.bones = []
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object, mesh: bpy.types.Mesh, loop: bpy.types.MeshLoop):
-        vertex = mesh.vertices[loop.vertex_index]
-        self.coords = vertex.co[0:3]
-        self.normal = loop.normal[0:3]
+        groups = numpy.empty(offsets[-1], dtype=numpy.int32)
+        values = numpy.empty(offsets[-1], dtype=numpy.float32)
 
-        if mesh.uv_layers:
-            self.uvs = mesh.uv_layers.active.data[loop.index].uv[0:2]
-        else:
-            self.uvs = [0.0, 0.0]
+        for index in numpy.flatnonzero(counts).tolist():
+            start, end = offsets[index], offsets[index + 1]
+            elements[index].foreach_get('group', groups[start:end])
+            elements[index].foreach_get('weight', values[start:end])
 
-        if armature:
-            for group in vertex.groups:
-                group: bpy.types.VertexGroupElement
+        return counts, groups, values
 
-                bone = object.vertex_groups[group.group]
 
-                if self.settings.prepend_armature:
-                    name = f'{armature.name}.{bone.name}'
-                else:
-                    name = bone.name
+class MeshCache:
+    '''Triangulated meshes shared by every SMD of one model export, so an object in several bodies is evaluated once.
+    Keyed by object, the state of its modifier stack, the export settings that change the evaluated mesh, and whether weights are read.'''
 
-                index = lookup[name]
+    def __init__(self):
+        self.entries = {}
 
-                if index != -1:
-                    weight = group.weight
-                    self.bones.append([index, weight])
+    def key(self, settings: Settings, object: bpy.types.Object, groups: bool) -> tuple:
+        modifiers = tuple((mod.name, mod.type, mod.show_viewport) for mod in getattr(object, 'modifiers', []))
+        return (object, modifiers, settings.ignore_transforms, settings.triangulation, groups)
 
-    def to_string(self) -> str:
-        parent = f'0'
-        coords = ' '.join(f'{n:.6f}' for n in self.coords)
-        normal = ' '.join(f'{n:.6f}' for n in self.normal)
-        uvs = ' '.join(f'{n:.6f}' for n in self.uvs)
-        count = f'{len(self.bones)}'
-        bones = ' '.join(f'{i} {w:.6f}' for i, w in self.bones)
-
-        if self.bones:
-            return f'{parent}  {coords}  {normal}  {uvs}  {count}  {bones}\n'
+    def get(self, settings: Settings, object: bpy.types.Object, groups: bool = False) -> MeshData:
+        key = self.key(settings, object, groups)
+
+        if key not in self.entries:
+            self.entries[key] = read_mesh(settings, object, groups)
+
+        return self.entries[key]
+
+
+def read_mesh(settings: Settings, object: bpy.types.Object, groups: bool = False) -> MeshData:
+    '''Evaluate and triangulate an object, reading its evaluated mesh directly when the settings and object allow it.
+    Objects that can't be read directly are read from a copy, which is triangulated and transformed the same way.
+    Vertex group weights are only read with groups, which only bodies weighted to an armature need.'''
+    if settings.triangulation == 'LOOP_TRIANGLES':
+        matrix = None if settings.ignore_transforms else object.matrix_world
+
+        if is_rest_evaluated(object):
+            context = evaluated_original(object)
         else:
-            return f'{parent}  {coords}  {normal}  {uvs}\n'
+            context = evaluated_mesh(settings, object, loop_triangles=True)
 
+        with context as mesh:
+            return MeshData(mesh, loop_triangles=True, matrix=matrix, groups=groups)
 
-class Triangle:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.material = ''
-        self.vertices = []
+    with evaluated_mesh(settings, object) as mesh:
+        return MeshData(mesh, groups=groups)
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object, mesh: bpy.types.Mesh, poly: bpy.types.MeshPolygon):
-        if poly.material_index < len(mesh.materials):
-            self.material = mesh.materials[poly.material_index]
-        self.material = getattr(self.material, 'name', 'no_material')
 
-        for loop in [mesh.loops[i] for i in poly.loop_indices]:
-            vertex = Vertex(self.settings)
-            vertex.from_blender(lookup, armature, object, mesh, loop)
-            self.vertices.append(vertex)
+def is_rest_evaluated(object: bpy.types.Object) -> bool:
+    '''Check whether the depsgraph already has this object evaluated the way it should be exported.
+    Objects deformed by an armature would come out posed, and objects outside the view layer aren't evaluated at all.'''
+    if not object.visible_get():
+        return False
 
-    def to_string(self) -> str:
-        material = f'{self.material}\n'
-        vertices = ''.join(vertex.to_string() for vertex in self.vertices)
-        return f'{material}{vertices}'
+    return not any(mod.type == 'ARMATURE' and mod.show_viewport for mod in getattr(object, 'modifiers', []))
 
 
-class Triangles:
-    def __init__(self, settings: Settings):
-        self.settings = settings
-        self.triangles = []
+@contextmanager
+def evaluated_original(object: bpy.types.Object) -> Iterator[bpy.types.Mesh]:
+    '''Get the evaluated mesh of an object without copying it, until the context exits.'''
+    depsgraph: bpy.types.Depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated: bpy.types.Object = object.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
 
-    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object):
-        if object.type not in {'MESH', 'CURVE', 'SURFACE', 'FONT'}:
-            return
+    try:
+        if hasattr(mesh, 'calc_normals_split'):
+            mesh.calc_normals_split()
+
+        yield mesh
+
+    finally:
+        evaluated.to_mesh_clear()
 
-        collection = bpy.data.collections.new('SourceOps')
-        bpy.context.scene.collection.children.link(collection)
-        object = object.copy()
-        collection.objects.link(object)
 
+@contextmanager
+def evaluated_mesh(settings: Settings, object: bpy.types.Object, loop_triangles: bool = False) -> Iterator[bpy.types.Mesh]:
+    '''Triangulate a copy of an object without its armature modifiers, and get its evaluated mesh until the context exits.
+    For loop triangles the copy is neither triangulated nor transformed, so it's read the same way as an evaluated original.'''
+    collection = bpy.data.collections.new('SourceOps')
+    bpy.context.scene.collection.children.link(collection)
+    object = object.copy()
+    collection.objects.link(object)
+
+    if not loop_triangles:
         mod: bpy.types.TriangulateModifier = object.modifiers.new('Triangulate', 'TRIANGULATE')
         mod.min_vertices = 4
         mod.quad_method = 'FIXED'
@@ -358,26 +573,25 @@ class Triangles:
         if hasattr(mod, 'keep_custom_normals'):
             mod.keep_custom_normals = True
 
-        for mod in getattr(object, 'modifiers', []):
-            if mod.type == 'ARMATURE':
-                mod.show_viewport = False
+    for mod in getattr(object, 'modifiers', []):
+        if mod.type == 'ARMATURE':
+            mod.show_viewport = False
 
-        bpy.context.view_layer.update()
-        depsgraph: bpy.types.Depsgraph = bpy.context.evaluated_depsgraph_get()
-        evaluated: bpy.types.Object = object.evaluated_get(depsgraph)
-        mesh = bpy.data.meshes.new_from_object(evaluated, preserve_all_data_layers=True, depsgraph=depsgraph)
+    bpy.context.view_layer.update()
+    depsgraph: bpy.types.Depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated: bpy.types.Object = object.evaluated_get(depsgraph)
+    mesh = bpy.data.meshes.new_from_object(evaluated, preserve_all_data_layers=True, depsgraph=depsgraph)
 
-        if not self.settings.ignore_transforms:
+    try:
+        if not settings.ignore_transforms and not loop_triangles:
             mesh.transform(object.matrix_world)
 
         if hasattr(mesh, 'calc_normals_split'):
             mesh.calc_normals_split()
 
-        for poly in mesh.polygons:
-            triangle = Triangle(self.settings)
-            triangle.from_blender(lookup, armature, object, mesh, poly)
-            self.triangles.append(triangle)
+        yield mesh
 
+    finally:
         if hasattr(mesh, 'free_normals_split'):
             mesh.free_normals_split()
 
@@ -385,44 +599,207 @@ class Triangles:
         bpy.data.objects.remove(object)
         bpy.data.collections.remove(collection)
 
-    def to_string(self) -> str:
-        header = f'triangles\n'
-        triangles = ''.join(triangle.to_string() for triangle in self.triangles)
-        footer = f'end\n'
-        return f'{header}{triangles}{footer}'
 
+class Triangles:
+    # Source models support at most this many bone weights per vertex.
+    WEIGHT_LIMIT = 3
 
-class SMD:
-    def __init__(self, prepend_armature: bool, ignore_transforms: bool):
-        self.settings = Settings(prepend_armature, ignore_transforms)
-        self.lookup = Lookup(self.settings)
-        self.nodes = Nodes(self.settings)
-        self.skeleton = Skeleton(self.settings)
-        self.triangles = Triangles(self.settings)
+    def __init__(self, settings: Settings, buffers: Buffers, meshes: MeshCache = None):
+        self.settings = settings
+        self.buffers = buffers
+        self.meshes = meshes
+
+    def from_blender(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object):
+        if object.type not in {'MESH', 'CURVE', 'SURFACE', 'FONT'}:
+            return
 
-    def configure_scene(self, objects: List[bpy.types.Object]) -> dict:
-        scene_settings = {'objects': {o: {} for o in objects}}
+        if not self.settings.bulk:
+            with evaluated_mesh(self.settings, object) as mesh:
+                return self.from_loops(lookup, armature, object, mesh)
 
-        if bpy.context.active_object:
-            scene_settings['mode'] = bpy.context.active_object.mode
+        # Weights are only read when there are bones to weight to.
+        groups = bool(armature and object.vertex_groups)
+
+        if self.meshes:
+            data = self.meshes.get(self.settings, object, groups)
         else:
-            scene_settings['mode'] = 'OBJECT'
+            data = read_mesh(self.settings, object, groups)
 
-        if scene_settings['mode'] != 'OBJECT':
-            bpy.ops.object.mode_set(mode='OBJECT')
+        self.from_data(lookup, armature, object, data)
 
-        for object in objects:
-            scene_settings['objects'][object]['hide_viewport'] = True if object.hide_viewport else False
-            object.hide_viewport = False
+    def from_data(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object, data: MeshData):
+        '''Add the triangles of a mesh read in bulk, with weights for the bones of this armature.'''
+        material_ids = self.buffers.add_materials(data.materials)[data.material_indices]
+
+        if armature:
+            offsets, bones, values = self.weights_from_blender(lookup, armature, object, data)
+            counts, gather = self.gather_weights(offsets, data.vertex_indices)
+            bones, values = bones[gather], values[gather]
+        else:
+            counts = numpy.zeros(len(data.vertex_indices), dtype=numpy.int32)
+            bones = numpy.empty(0, dtype=numpy.int32)
+            values = numpy.empty(0, dtype=numpy.float32)
+
+        self.buffers.add_triangles(material_ids, data.coords, data.normals, data.uvs, counts, bones, values)
+
+    def from_loops(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object, mesh: bpy.types.Mesh):
+        '''Read a triangulated mesh one loop at a time, slow but useful for debugging the bulk path.'''
+        materials = []
+        coords = []
+        normals = []
+        uvs = []
+        counts = []
+        bones = []
+        values = []
+
+        for poly in mesh.polygons:
+            if poly.material_index < len(mesh.materials):
+                material = mesh.materials[poly.material_index]
+            else:
+                material = None
+            materials.append(getattr(material, 'name', 'no_material'))
 
-        return scene_settings
+            for loop in [mesh.loops[i] for i in poly.loop_indices]:
+                vertex = mesh.vertices[loop.vertex_index]
+                coords.append(vertex.co[0:3])
+                normals.append(loop.normal[0:3])
 
-    def restore_scene(self, scene_settings: dict):
-        for object in scene_settings['objects'].keys():
-            object.hide_viewport = scene_settings['objects'][object]['hide_viewport']
+                if mesh.uv_layers:
+                    uvs.append(mesh.uv_layers.active.data[loop.index].uv[0:2])
+                else:
+                    uvs.append([0.0, 0.0])
+
+                count = 0
+
+                if armature:
+                    for group in vertex.groups:
+                        group: bpy.types.VertexGroupElement
+                        bone = object.vertex_groups[group.group]
+                        index = lookup[lookup.name(armature, bone.name)]
+
+                        if index != -1:
+                            bones.append(index)
+                            values.append(group.weight)
+                            count += 1
+
+                counts.append(count)
+
+        self.buffers.add_triangles(
+            self.buffers.add_materials(materials),
+            numpy.array(coords, dtype=numpy.float32).reshape(-1, 3),
+            numpy.array(normals, dtype=numpy.float32).reshape(-1, 3),
+            numpy.array(uvs, dtype=numpy.float32).reshape(-1, 2),
+            numpy.array(counts, dtype=numpy.int32),
+            numpy.array(bones, dtype=numpy.int32),
+            numpy.array(values, dtype=numpy.float32),
+        )
+
+    def weights_from_blender(self, lookup: Lookup, armature: bpy.types.Object, object: bpy.types.Object, data: MeshData) -> tuple:
+        '''Get bone weights per vertex as CSR arrays of offsets, bone indices and weights.'''
+        counts, groups, values = data.group_counts, data.groups, data.weights
+
+        # Map vertex groups to SMD bones in one gather, then drop groups without a bone.
+        bones = lookup.remap(armature, object)[groups]
+        keep = bones != -1
+        owners = numpy.repeat(numpy.arange(len(counts), dtype=numpy.int32), counts)[keep]
+
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(owners, minlength=len(counts)), out=offsets[1:])
+
+        if self.settings.limit_weights:
+            return self.limit_weights(offsets, bones[keep], values[keep])
+        else:
+            return offsets, bones[keep], values[keep]
+
+    def limit_weights(self, offsets: numpy.ndarray, bones: numpy.ndarray, values: numpy.ndarray) -> tuple:
+        '''Keep the strongest weights of each vertex up to the weight limit, and renormalize them.'''
+        counts = offsets[1:] - offsets[:-1]
+        owners = numpy.repeat(numpy.arange(len(counts), dtype=numpy.int32), counts)
+
+        # Sort each vertex by descending weight, then rank every weight within its vertex.
+        order = numpy.lexsort((-values, owners))
+        ranks = numpy.arange(len(order), dtype=numpy.int32) - offsets[:-1][owners]
+        order = order[ranks < self.WEIGHT_LIMIT]
+
+        owners = owners[order]
+        bones = bones[order]
+        values = values[order].astype(numpy.float64)
+
+        totals = numpy.bincount(owners, weights=values, minlength=len(counts))
+        totals = totals[owners]
+        values = numpy.divide(values, totals, out=values, where=totals > 0)
+
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(owners, minlength=len(counts)), out=offsets[1:])
+        return offsets, bones, values.astype(numpy.float32)
+
+    def gather_weights(self, offsets: numpy.ndarray, vertex_indices: numpy.ndarray) -> tuple:
+        '''Get the weight count of each loop, and the indices that gather per vertex weights into per loop weights.'''
+        counts = (offsets[1:] - offsets[:-1])[vertex_indices]
+        starts = numpy.repeat(offsets[:-1][vertex_indices], counts)
+        firsts = numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        gather = starts + numpy.arange(len(starts), dtype=numpy.int32) - firsts
+        return counts, gather
+
+    def chunks(self, size: int) -> Iterator[str]:
+        return serialize.triangles(self.buffers, size)
+
+    def to_string(self) -> str:
+        return ''.join(self.chunks(len(self.buffers.coords) or 1))
+
+
+class ArmatureData:
+    '''The bone table, node block and rest pose block of one armature, formatted once.'''
+
+    def __init__(self, settings: Settings, armature: bpy.types.Object):
+        self.buffers = Buffers()
+        self.lookup = Lookup(settings)
+        self.lookup.from_blender(armature)
+
+        nodes = Nodes(settings, self.buffers)
+        nodes.from_blender(self.lookup, armature)
+        self.nodes = nodes.to_string()
+
+        skeleton = Skeleton(settings, self.buffers)
+        skeleton.from_blender(self.lookup, armature, None)
+        self.rest = skeleton.to_string()
+
+        self.samples = {}
+
+
+class ArmatureCache:
+    '''Armature data shared by every SMD of one model export, keyed by armature and export settings.'''
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, settings: Settings, armature: bpy.types.Object) -> ArmatureData:
+        key = (armature, settings.prepend_armature, settings.ignore_transforms)
 
-        if scene_settings['mode'] != 'OBJECT':
-            bpy.ops.object.mode_set(mode=scene_settings['mode'])
+        if key not in self.entries:
+            self.entries[key] = ArmatureData(settings, armature)
+
+        return self.entries[key]
+
+
+class SMD:
+    def __init__(self, prepend_armature: bool, ignore_transforms: bool, limit_weights: bool = False, sampling: str = 'SCENE', triangulation: str = 'MODIFIER', bulk: bool = True, cache: ArmatureCache = None, meshes: MeshCache = None, state: SceneState = None):
+        self.settings = Settings(prepend_armature, ignore_transforms, limit_weights, sampling, triangulation, bulk)
+        self.cache = cache
+        self.state = state
+        self.buffers = Buffers()
+        self.lookup = Lookup(self.settings)
+        self.nodes = Nodes(self.settings, self.buffers)
+        self.skeleton = Skeleton(self.settings, self.buffers)
+        self.triangles = Triangles(self.settings, self.buffers, meshes)
+
+    def configure_scene(self, state: SceneState, objects: List[bpy.types.Object]):
+        state.object_mode()
+
+        for object in objects:
+            state.show(object)
+
+        state.update()
 
     def from_blender(self, armature: bpy.types.Object, objects: List[bpy.types.Object], action: bpy.types.Action):
         if armature:
@@ -430,20 +807,58 @@ class SMD:
         else:
             all_objects = set(objects)
 
-        scene_settings = self.configure_scene(all_objects)
+        with scene_state(self.state) as state:
+            self.configure_scene(state, all_objects)
 
-        self.lookup.from_blender(armature)
-        self.nodes.from_blender(self.lookup, armature)
-        self.skeleton.from_blender(self.lookup, armature, action)
+            if self.cache:
+                self.from_cache(armature, action)
+            else:
+                self.lookup.from_blender(armature)
+                self.nodes.from_blender(self.lookup, armature)
+                self.skeleton.from_blender(self.lookup, armature, action)
 
-        for object in objects:
-            self.triangles.from_blender(self.lookup, armature, object)
+            for object in objects:
+                self.triangles.from_blender(self.lookup, armature, object)
+
+        self.buffers.pack()
+
+    def sample(self, armature: bpy.types.Object, actions: List[bpy.types.Action]):
+        '''Sample many actions in one pass over the timeline, and keep the frames in the cache for the SMD of each sequence.'''
+        data = self.cache.get(self.settings, armature)
+        actions = [action for action in actions if action not in data.samples]
+
+        if not armature or not actions:
+            return
+
+        with scene_state(self.state) as state:
+            self.configure_scene(state, [armature])
+            data.samples.update(self.skeleton.sample(armature, actions))
 
-        self.restore_scene(scene_settings)
+    def from_cache(self, armature: bpy.types.Object, action: bpy.types.Action):
+        '''Reuse the bone table, nodes, rest pose and sampled actions of this armature from the export cache.'''
+        data = self.cache.get(self.settings, armature)
+        self.lookup = data.lookup
+
+        self.buffers.node_names = data.buffers.node_names
+        self.buffers.node_parents = data.buffers.node_parents
+        self.buffers.node_text = data.nodes
+
+        if action in data.samples:
+            self.skeleton.from_samples(self.lookup, armature, *data.samples[action])
+        elif action:
+            self.skeleton.from_blender(self.lookup, armature, action)
+        else:
+            self.buffers.frame_bones = data.buffers.frame_bones
+            self.buffers.frame_times = data.buffers.frame_times
+            self.buffers.frame_transforms = data.buffers.frame_transforms
+            self.buffers.frame_text = data.rest
+
+    def chunks(self, size: int) -> Iterator[str]:
+        return serialize.chunks(self.buffers, size)
 
     def to_string(self) -> str:
-        version = f'version 1\n'
-        nodes = self.nodes.to_string()
-        skeleton = self.skeleton.to_string()
-        triangles = self.triangles.to_string()
-        return f'{version}{nodes}{skeleton}{triangles}'
+        return ''.join(self.chunks(len(self.buffers.coords) + self.buffers.frame_transforms.size + 1))
+
+    def write(self, file: BinaryIO, buffer_size: int = 1 << 20):
+        '''Stream the SMD to a binary file, formatting the next chunk while the previous one is written.'''
+        serialize.write(file, self.buffers, buffer_size)
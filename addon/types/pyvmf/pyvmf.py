@@ -7,6 +7,7 @@ import math
 import operator
 from random import randint
 from . tools import num
+from .. import formatting
 from . importer import *
 from typing import List, Tuple, Generator
 
@@ -2405,18 +2406,21 @@ class VMF:
         # The category name is always one less indent from the data/children, and since self.indent keeps track of the
         # data indent and not the category indent (doesn't matter which one you track as long as it's always the same)
         t = "\t" * (self.__indent - 1)
-        self.file.write(f"{t}{name}\n{t}{{\n")
+        header = f"{t}{name}\n{t}{{\n"
         t += "\t"
 
+        # Collect every key value pair first, then format them all with one template and write once
+        rows = []
         for item in info_list:
             if not item:
                 continue
 
             if type(item) is dict:
-                for i, j in item.items():
-                    self.file.write(f"{t}\"{i}\" \"{str(j)}\"\n")
+                rows.extend(item.items())
             else:
-                self.file.write(f"{t}\"{item[0]}\" \"{str(item[1])}\"\n")
+                rows.append((item[0], item[1]))
+
+        self.file.write(header + formatting.format_rows(f"{t}\"%s\" \"%s\"\n", rows))
 
 
 def load_vmf(name: str, merge_vertices=0.0001) -> VMF:
@@ -1,6 +1,16 @@
 import bpy
+from pathlib import Path
 from .. utils import common
 from .. import icons
+from .. ops . compile_background import SOURCEOPS_OT_CompileBackground
+from .. types . model_export . compile_log import DiagnosticsIndex
+
+
+STATUS_ICONS = {'QUEUED': 'TIME', 'RUNNING': 'SORTTIME', 'DONE': 'CHECKMARK', 'FAILED': 'ERROR', 'CANCELLED': 'CANCEL'}
+SEVERITY_ICONS = {'ERROR': 'ERROR', 'WARNING': 'INFO'}
+
+# Diagnostics drawn at most, the search narrows down the rest.
+DIAGNOSTICS_LIMIT = 50
 
 
 class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
@@ -55,6 +65,10 @@ class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
                 col.prop(game, 'mapsrc')
                 col.prop(game, 'mesh_type')
 
+                sub = col.column()
+                sub.enabled = game.mesh_type == 'FBX'
+                sub.prop(game, 'fbx_writer')
+
         elif sourceops and sourceops.panel == 'MODELS':
             box = layout.box()
             row = box.row()
@@ -100,6 +114,10 @@ class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
             col = common.split_column(box)
             col.prop(model, 'prepend_armature')
             col.prop(model, 'ignore_transforms')
+            col.prop(model, 'limit_weights')
+            col.prop(model, 'sampling')
+            col.prop(model, 'triangulation')
+            col.prop(model, 'skip_unchanged')
 
             sub = col.column()
             sub.enabled = not (model.static and model.static_prop_combine)
@@ -238,7 +256,10 @@ class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
                 col.prop(attachment, 'absolute')
                 col.prop(attachment, 'rigid')
 
-        if sourceops.panel in {'GAMES', 'MODELS', 'MODEL_OPTIONS', 'TEXTURES', 'SEQUENCES', 'EVENTS', 'ATTACHMENTS', 'PARTICLES'}:
+        elif sourceops and sourceops.panel == 'DIAGNOSTICS':
+            self.draw_diagnostics(layout, sourceops, game)
+
+        if sourceops.panel in {'GAMES', 'MODELS', 'MODEL_OPTIONS', 'TEXTURES', 'SEQUENCES', 'EVENTS', 'ATTACHMENTS', 'PARTICLES', 'DIAGNOSTICS'}:
             box = layout.box()
             row = box.row()
             row.scale_x = row.scale_y = 1.5
@@ -250,9 +271,12 @@ class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
             row.operator('sourceops.export_meshes', text='', icon_value=icons.id('smd'))
             row.operator('sourceops.generate_qc', text='', icon_value=icons.id('qc'))
             row.operator('sourceops.compile_qc', text='', icon_value=icons.id('mdl'))
+            row.operator('sourceops.compile_background', text='', icon='SORTTIME')
             row.operator('sourceops.view_model', text='', icon_value=icons.id('hlmv'))
             row.operator('sourceops.export_auto', text='', icon='AUTO')
 
+            self.draw_compile_status(layout)
+
         if sourceops and sourceops.panel == 'MAPS':
             box = layout.box()
             row = box.row()
@@ -308,6 +332,64 @@ class SOURCEOPS_PT_MainPanel(bpy.types.Panel):
             col.operator('sourceops.pose_bone_transforms', text='Copy Pose Bone Translation').type = 'TRANSLATION'
             col.operator('sourceops.pose_bone_transforms', text='Copy Pose Bone Rotation').type = 'ROTATION'
 
+    def draw_diagnostics(self, layout, sourceops, game):
+        box = layout.box()
+        row = box.row()
+        row.alignment = 'CENTER'
+        row.label(text='Diagnostics')
+
+        col = common.split_column(box)
+        col.prop(sourceops, 'diagnostics_search')
+        col.prop(sourceops, 'diagnostics_severity')
+        col.prop(sourceops, 'diagnostics_sort')
+        col.prop(sourceops, 'diagnostics_all_games')
+
+        index = DiagnosticsIndex(common.cache_folder().joinpath('diagnostics.json'))
+        game_path = None if sourceops.diagnostics_all_games or not game else str(Path(game.game))
+        records = index.records(game_path, sourceops.diagnostics_severity, sourceops.diagnostics_search, sourceops.diagnostics_sort)
+
+        if not records:
+            box.label(text='No diagnostics found')
+            return
+
+        col = box.column(align=True)
+        for record in records[:DIAGNOSTICS_LIMIT]:
+            sub = col.box().column(align=True)
+            sub.label(text=f'{record["model"]}: {record["message"]}', icon=SEVERITY_ICONS.get(record['severity'], 'INFO'))
+
+            details = [f'Log line {record["line"]}']
+            if record.get('smd'):
+                details.append(record['smd'])
+            if record.get('material'):
+                details.append(record['material'])
+            sub.label(text='    '.join(details))
+
+        if len(records) > DIAGNOSTICS_LIMIT:
+            box.label(text=f'{len(records) - DIAGNOSTICS_LIMIT} more, narrow down the search to see them')
+
+    def draw_compile_status(self, layout):
+        scheduler = SOURCEOPS_OT_CompileBackground.scheduler
+
+        if not scheduler or not scheduler.jobs:
+            return
+
+        running = SOURCEOPS_OT_CompileBackground.is_running()
+
+        box = layout.box()
+        row = box.row()
+        row.alignment = 'CENTER'
+        row.label(text='Compiling' if running else 'Compile Results')
+
+        col = box.column(align=True)
+        for job in scheduler.jobs:
+            row = col.row()
+            row.label(text=job.name, icon=STATUS_ICONS[job.status])
+            status = 'Cancelling' if job.status == 'RUNNING' and job.cancel_requested else job.status.title()
+            row.label(text=f'{status}    {round(job.duration, 1)}s')
+
+        if running:
+            box.label(text='Press Esc to cancel', icon='INFO')
+
     def draw_list_buttons(self, layout, item):
         op = layout.operator('sourceops.list_operator', text='', icon='ADD')
         op.mode, op.item = 'ADD', item
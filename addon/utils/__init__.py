@@ -1,3 +1,5 @@
 from . import common
 from . import game
 from . import backup
+from . import wine
+from . import scene_state
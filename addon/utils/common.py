@@ -136,6 +136,10 @@ def appdata():
     return pathlib.Path(user).resolve()
 
 
+def cache_folder():
+    return appdata().joinpath('cache', 'sourceops')
+
+
 def resolve(path):
     if path:
         return str(pathlib.Path(bpy.path.abspath(path)).resolve())
@@ -145,3 +149,7 @@ def resolve(path):
 
 def update_wine(self, context):
     self['wine'] = resolve(self.wine)
+
+
+def update_wine_prefix(self, context):
+    self['wine_prefix'] = resolve(self.wine_prefix)
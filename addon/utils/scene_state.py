@@ -0,0 +1,97 @@
+import bpy
+from mathutils import Color, Euler, Matrix, Quaternion, Vector
+from contextlib import contextmanager
+from traceback import print_exc
+from typing import Callable, Iterator
+
+
+class SceneState:
+    '''Scene changes made for an export, undone in reverse order when the context exits, also after an error.
+    Every value is saved the first time it changes, so exporters can share one state across many bodies.'''
+
+    def __init__(self):
+        self.journal = []
+        self.saved = set()
+        self.dirty = False
+
+    def __enter__(self) -> 'SceneState':
+        return self
+
+    def __exit__(self, *args):
+        self.restore()
+
+    def defer(self, callback: Callable):
+        '''Run a function when the state is restored, for changes that aren't a single property.'''
+        self.journal.append(callback)
+        self.dirty = True
+
+    def set(self, owner, attribute: str, value):
+        '''Set a property, and put the value it had before the first change back when the state is restored.'''
+        key = (owner, attribute)
+
+        if key not in self.saved:
+            self.saved.add(key)
+            original = getattr(owner, attribute)
+
+            # Math values are views into the owner, they would change along with it.
+            if isinstance(original, (Color, Euler, Matrix, Quaternion, Vector)):
+                original = original.copy()
+
+            self.journal.append(lambda: setattr(owner, attribute, original))
+
+        setattr(owner, attribute, value)
+        self.dirty = True
+
+    def object_mode(self):
+        '''Switch to object mode so mesh data is up to date, and switch back to the previous mode when restored.'''
+        active = bpy.context.active_object
+
+        if active and active.mode != 'OBJECT':
+            mode = active.mode
+            bpy.ops.object.mode_set(mode='OBJECT')
+            self.defer(lambda: bpy.ops.object.mode_set(mode=mode))
+
+    def show(self, object: bpy.types.Object):
+        if object.hide_viewport:
+            self.set(object, 'hide_viewport', False)
+
+    def link(self, collection: bpy.types.Collection, object: bpy.types.Object):
+        if collection not in object.users_collection:
+            collection.objects.link(object)
+            self.defer(lambda: collection.objects.unlink(object))
+
+    def new_collection(self, name: str) -> bpy.types.Collection:
+        '''Make a collection in the scene, it's removed when restored.'''
+        collection = bpy.data.collections.new(name)
+        bpy.context.scene.collection.children.link(collection)
+        self.defer(lambda: bpy.data.collections.remove(collection))
+        return collection
+
+    def update(self):
+        '''Update the view layer once for all changes since the last update, instead of once per change.'''
+        if self.dirty:
+            bpy.context.view_layer.update()
+            self.dirty = False
+
+    def restore(self):
+        '''Undo every change, newest first, one failed step doesn't stop the rest.'''
+        while self.journal:
+            callback = self.journal.pop()
+
+            try:
+                callback()
+            except:
+                print_exc()
+
+        self.saved.clear()
+        self.dirty = False
+
+
+@contextmanager
+def scene_state(state: SceneState = None) -> Iterator[SceneState]:
+    '''Use the given state, or a new one that is restored when the context exits.'''
+    if state:
+        yield state
+    else:
+        with SceneState() as state:
+            yield state
@@ -0,0 +1,141 @@
+import atexit
+import os
+import shutil
+import socket
+import subprocess
+from pathlib import Path
+from threading import Lock
+
+
+# Seconds the wineserver stays alive after the last program exits, so it never outlives Blender for long.
+PERSISTENCE = 600
+
+
+class WineSession:
+    '''One Wine prefix with a persistent wineserver, shared by every StudioMDL and HLMV launch.
+    Starting a wineserver takes seconds, keeping one alive makes every launch after the first one fast.'''
+
+    def __init__(self, wine: Path, prefix: Path = None):
+        self.wine = wine
+        self.wineserver = self.find_wineserver()
+        self.prefix = prefix or Path(os.environ.get('WINEPREFIX') or Path.home().joinpath('.wine'))
+        self.env = dict(os.environ, WINEPREFIX=str(self.prefix), WINEDEBUG=os.environ.get('WINEDEBUG', '-all'))
+        self.server = None
+        self.trusted = True
+        self.processes = []
+        self.lock = Lock()
+
+    def find_wineserver(self) -> Path:
+        sibling = self.wine.with_name('wineserver')
+
+        if sibling.is_file():
+            return sibling
+
+        found = shutil.which('wineserver')
+        return Path(found) if found else None
+
+    def socket_path(self) -> Path:
+        '''Get the socket of the wineserver for this prefix, Wine names its directory after the device and inode of the prefix.'''
+        stat = self.prefix.stat()
+        return Path(f'/tmp/.wine-{os.getuid()}', f'server-{stat.st_dev:x}-{stat.st_ino:x}', 'socket')
+
+    def is_alive(self) -> bool:
+        '''Check whether a wineserver is accepting connections for this prefix.'''
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(1)
+                client.connect(str(self.socket_path()))
+        except OSError:
+            return False
+
+        return True
+
+    def socket_id(self) -> tuple:
+        '''Identify the running wineserver by its socket, a new server makes a new socket.'''
+        stat = self.socket_path().stat()
+        return stat.st_dev, stat.st_ino
+
+    def start(self):
+        '''Start a wineserver that stays alive for a while after the last program exits, it forks into the background on its own.'''
+        self.prefix.mkdir(parents=True, exist_ok=True)
+        result = subprocess.run([str(self.wineserver), f'-p{PERSISTENCE}'], env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+
+        # When the server isn't where it's expected, the socket check can't be trusted, Wine is left to start its own servers.
+        if not self.is_alive():
+            print(f'Wineserver socket not found, not managing the wineserver for: {self.prefix}')
+            self.trusted = False
+            return
+
+        # Wineserver fails when a server is already running, that one isn't ours to stop.
+        if result.returncode == 0:
+            self.server = self.socket_id()
+
+    def ensure(self):
+        if not self.wineserver or not self.trusted:
+            return
+
+        with self.lock:
+            if not self.is_alive():
+                print(f'Starting wineserver for: {self.prefix}')
+
+                try:
+                    self.start()
+                except (OSError, subprocess.SubprocessError) as exception:
+                    print(f'Failed to start wineserver: {exception}')
+
+    def popen(self, args: list, **kwargs) -> subprocess.Popen:
+        '''Run a Windows program in this session, kwargs are passed on to Popen.'''
+        self.ensure()
+        process = subprocess.Popen([str(self.wine)] + list(args), env=self.env, **kwargs)
+
+        with self.lock:
+            self.processes = [running for running in self.processes if running.poll() is None] + [process]
+
+        return process
+
+    def owns_server(self) -> bool:
+        '''Check whether the running wineserver is the one this session started.'''
+        try:
+            return self.server is not None and self.is_alive() and self.socket_id() == self.server
+        except OSError:
+            return False
+
+    def shutdown(self):
+        '''Stop the wineserver, but only if this session started it and nothing it launched is still running.
+        Any other server is left alone, it exits on its own once its programs are done.'''
+        with self.lock:
+            idle = all(process.poll() is not None for process in self.processes)
+
+            if self.wineserver and idle and self.owns_server():
+                try:
+                    subprocess.run([str(self.wineserver), '-k'], env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+                except (OSError, subprocess.SubprocessError):
+                    pass
+
+            self.server = None
+            self.processes = []
+
+
+sessions = {}
+sessions_lock = Lock()
+
+
+def get_session(wine: Path, prefix: Path = None) -> WineSession:
+    with sessions_lock:
+        key = (str(wine), str(prefix) if prefix else None)
+
+        if key not in sessions:
+            sessions[key] = WineSession(wine, prefix)
+
+        return sessions[key]
+
+
+def shutdown():
+    with sessions_lock:
+        for session in sessions.values():
+            session.shutdown()
+
+        sessions.clear()
+
+
+atexit.register(shutdown)